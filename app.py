@@ -1,20 +1,19 @@
 import os
 import logging
+import threading
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-
 class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
 
-# Create the app
+# Create the app. Importing this module only configures objects; routes,
+# tables and background services are set up by create_app().
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
@@ -30,11 +29,62 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 db.init_app(app)
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', logger=False, engineio_logger=False)
 
-with app.app_context():
-    # Import models and routes
-    import models
-    import routes
-    import websocket_handler
-    
-    # Create all database tables
-    db.create_all()
+_startup_lock = threading.Lock()
+_services_started = False
+
+def configure_logging():
+    """Root logging for the server process; LOG_LEVEL defaults to INFO"""
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+def create_app(start_services=True):
+    """Register routes and socket handlers, and optionally start the server's services.
+
+    Safe to call more than once. Tools and benchmarks that only need the
+    routes (or nothing at all) can skip start_services and call
+    init_services() themselves.
+    """
+    with app.app_context():
+        # Import models and routes
+        import models  # noqa: F401
+        import routes  # noqa: F401
+        import websocket_handler  # noqa: F401
+
+    if start_services:
+        init_services()
+    return app
+
+def init_services(media_server=True):
+    """Create tables and start the background services: the local speech pool (if configured),
+    the call-state and statistics workers and the media server (idempotent)"""
+    global _services_started
+    with _startup_lock:
+        if _services_started:
+            return
+        _services_started = True
+
+        from call_state import call_state
+        from call_stats import call_stats
+        from websocket_handler import start_media_server
+
+        # The speech engine pool forks its workers, so it goes before any threads
+        start_speech_pool()
+
+        with app.app_context():
+            # Create all database tables
+            db.create_all()
+
+        call_state.start()
+        # Seed statistics once the tables exist
+        call_stats.start()
+        if media_server:
+            start_media_server()
+
+def start_speech_pool():
+    """Fork the local speech engine pool when PROVIDER_BACKEND=local (idempotent).
+
+    Forking is only safe while this process has no other threads, so servers
+    that start threads of their own call this first (see gunicorn.conf.py).
+    """
+    if os.environ.get('PROVIDER_BACKEND') == 'local':
+        from local_speech import get_speech_pool
+        get_speech_pool().start()
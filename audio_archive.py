@@ -0,0 +1,266 @@
+"""Append-only archive of raw call audio.
+
+Each call gets a directory under ``AUDIO_ARCHIVE_DIR`` holding one track per
+direction. A track is a series of segment files of raw 8 kHz mu-law audio
+(``inbound-00000.ulaw``) and a matching frame index (``inbound-00000.idx``).
+Index records are fixed 16-byte entries ``(t_ms, offset, length, flags)``
+describing contiguous runs of audio; a zero-length record with ``TURN_END``
+set marks the end of a caller turn. Inbound audio and turn ends are stamped
+with the media stream's own timestamps (ms since stream start), so lost or
+late frames don't shift the timeline; outbound audio uses the recorder clock
+from stream start.
+
+Writes go into preallocated per-track buffers on the event loop and are
+handed to a single background thread for the actual file I/O.
+"""
+import os
+import mmap
+import queue
+import struct
+import logging
+import threading
+import time
+from collections import deque
+
+INBOUND = 'inbound'
+OUTBOUND = 'outbound'
+
+TURN_END = 0x1
+
+INDEX_RECORD = struct.Struct('<IIII')  # t_ms, offset, length, flags
+
+BUFFER_BYTES = 32000       # ~4 seconds of mu-law per direction
+INDEX_BUFFER_RECORDS = 256
+SEGMENT_BYTES = 8000 * 600  # 10 minutes of audio per segment file
+RUN_GAP_MS = 200           # a pause longer than this starts a new index run
+MEDIA_RUN_GAP_MS = 10      # same, for audio stamped with media timestamps (half a frame)
+
+
+def archive_dir():
+    return os.environ.get('AUDIO_ARCHIVE_DIR')
+
+
+class _ArchiveWriter:
+    """Process-wide background thread that performs all archive file writes"""
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, job):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name='audio-archive-writer', daemon=True)
+                    self.thread.start()
+        self.jobs.put(job)
+
+    def _run(self):
+        while True:
+            data_path, data_buf, data_len, idx_path, idx_buf, idx_len, free_list, done = self.jobs.get()
+            try:
+                if data_len:
+                    with open(data_path, 'ab') as f:
+                        f.write(memoryview(data_buf)[:data_len])
+                if idx_len:
+                    with open(idx_path, 'ab') as f:
+                        f.write(memoryview(idx_buf)[:idx_len])
+            except Exception as e:
+                logging.error(f"Error writing audio archive segment {data_path}: {str(e)}")
+            finally:
+                free_list.append((data_buf, idx_buf))
+                if done is not None:
+                    done.set()
+
+
+_writer = _ArchiveWriter()
+
+
+class _Track:
+    """Buffered append-only writer for one direction of one call"""
+
+    def __init__(self, call_dir, direction):
+        self.call_dir = call_dir
+        self.direction = direction
+        self.buf = bytearray(BUFFER_BYTES)
+        self.idx = bytearray(INDEX_RECORD.size * INDEX_BUFFER_RECORDS)
+        self.free = deque()
+        self.fill = 0
+        self.idx_fill = 0
+        self.segment = 0
+        self.segment_offset = 0
+        self.run_start_ms = 0
+        self.run_offset = 0
+        self.run_len = 0
+
+    def _paths(self):
+        base = os.path.join(self.call_dir, f"{self.direction}-{self.segment:05d}")
+        return base + '.ulaw', base + '.idx'
+
+    def write(self, data, now_ms, gap_ms=RUN_GAP_MS):
+        n = len(data)
+        if self.run_len and now_ms > self.run_start_ms + self.run_len // 8 + gap_ms:
+            self._close_run(0)
+        if self.fill + n > len(self.buf):
+            self.flush()
+            if n > len(self.buf):
+                self.buf = bytearray(n)
+        if not self.run_len:
+            self.run_start_ms = now_ms
+            self.run_offset = self.segment_offset
+        self.buf[self.fill:self.fill + n] = data
+        self.fill += n
+        self.segment_offset += n
+        self.run_len += n
+
+    def mark(self, now_ms, flags):
+        self._close_run(0)
+        self._add_record(now_ms, self.segment_offset, 0, flags)
+
+    def _close_run(self, flags):
+        if self.run_len:
+            self._add_record(self.run_start_ms, self.run_offset, self.run_len, flags)
+            self.run_len = 0
+
+    def _add_record(self, t_ms, offset, length, flags):
+        if self.idx_fill + INDEX_RECORD.size > len(self.idx):
+            # Not flush(): that closes the open run, which adds a record again
+            self._submit()
+        INDEX_RECORD.pack_into(self.idx, self.idx_fill, t_ms, offset, length, flags)
+        self.idx_fill += INDEX_RECORD.size
+
+    def flush(self, done=None):
+        """Hand the filled buffers to the writer thread and continue in fresh ones"""
+        self._close_run(0)
+        self._submit(done)
+        if self.segment_offset >= SEGMENT_BYTES:
+            self.segment += 1
+            self.segment_offset = 0
+
+    def _submit(self, done=None):
+        if not self.fill and not self.idx_fill:
+            if done is not None:
+                done.set()
+            return
+        data_path, idx_path = self._paths()
+        _writer.submit((data_path, self.buf, self.fill, idx_path, self.idx, self.idx_fill, self.free, done))
+        if self.free:
+            self.buf, self.idx = self.free.popleft()
+        else:
+            self.buf = bytearray(BUFFER_BYTES)
+            self.idx = bytearray(INDEX_RECORD.size * INDEX_BUFFER_RECORDS)
+        self.fill = 0
+        self.idx_fill = 0
+
+
+class CallRecorder:
+    """Records both directions of a call into the audio archive"""
+
+    def __init__(self, call_dir, clock=time.monotonic):
+        os.makedirs(call_dir, exist_ok=True)
+        self.call_dir = call_dir
+        self.clock = clock
+        self.start_time = clock()
+        self.inbound = _Track(call_dir, INBOUND)
+        self.outbound = _Track(call_dir, OUTBOUND)
+        self.closed = False
+
+    def _now_ms(self):
+        return int((self.clock() - self.start_time) * 1000)
+
+    def write_inbound(self, mulaw_frame, t_ms=None):
+        """Append a raw mu-law frame received from the caller, starting at media time t_ms"""
+        if not self.closed:
+            if t_ms is None:
+                self.inbound.write(mulaw_frame, self._now_ms())
+            else:
+                self.inbound.write(mulaw_frame, t_ms, MEDIA_RUN_GAP_MS)
+
+    def write_outbound(self, mulaw_frame):
+        """Append a raw mu-law frame sent to the caller"""
+        if not self.closed:
+            self.outbound.write(mulaw_frame, self._now_ms())
+
+    def mark_turn_end(self, t_ms=None):
+        """Record the end of a caller turn (utterance handed to speech-to-text) at media time t_ms"""
+        if not self.closed:
+            self.inbound.mark(self._now_ms() if t_ms is None else t_ms, TURN_END)
+
+    def close(self, wait=False):
+        """Flush remaining audio; optionally block until it is on disk"""
+        if self.closed:
+            return
+        self.closed = True
+        events = [threading.Event(), threading.Event()]
+        self.inbound.flush(events[0])
+        self.outbound.flush(events[1])
+        if wait:
+            for event in events:
+                event.wait()
+
+
+def open_recorder(call_sid, clock=time.monotonic):
+    """Create a recorder for this call, or None when archiving is disabled"""
+    root = archive_dir()
+    if not root or not call_sid:
+        return None
+    try:
+        return CallRecorder(os.path.join(root, call_sid), clock=clock)
+    except Exception as e:
+        logging.error(f"Error opening audio archive for {call_sid}: {str(e)}")
+        return None
+
+
+class ArchiveReader:
+    """Memory-mapped read access to an archived call"""
+
+    def __init__(self, call_dir):
+        self.call_dir = call_dir
+        self._maps = []
+
+    def _segments(self, direction):
+        names = sorted(name for name in os.listdir(self.call_dir)
+                       if name.startswith(direction + '-') and name.endswith('.ulaw'))
+        for name in names:
+            base = os.path.join(self.call_dir, name[:-len('.ulaw')])
+            yield self._map(base + '.ulaw'), self._map(base + '.idx')
+
+    def _map(self, path):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return b''
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return mapped
+
+    def runs(self, direction):
+        """Yield (t_ms, flags, audio) for each indexed run; audio is a zero-copy memoryview"""
+        for data, index in self._segments(direction):
+            view = memoryview(data) if data else memoryview(b'')
+            for t_ms, offset, length, flags in INDEX_RECORD.iter_unpack(index):
+                yield t_ms, flags, view[offset:offset + length]
+
+    def turn_ends(self):
+        """Timestamps (ms from call start) of recorded caller turn boundaries"""
+        return [t_ms for t_ms, flags, audio in self.runs(INBOUND) if flags & TURN_END]
+
+    def read(self, direction):
+        """Whole track as bytes"""
+        return b''.join(bytes(data) for data, _ in self._segments(direction))
+
+    def close(self):
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                # A memoryview handed out by runs() is still alive; the map closes when it is released
+                pass
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -1,12 +1,19 @@
 import base64
 import audioop
 import logging
-from collections import deque
-import time
 
 class AudioProcessor:
+    # One of these exists per live call, so keep instances compact
+    __slots__ = ('audio_buffer', 'silence_threshold', 'min_speech_duration', 'max_speech_duration',
+                 'silence_duration', 'min_buffer_duration', 'last_speech_time', 'utterance_start_time',
+                 'consecutive_silence_count', 'speech_detected', 'recorder', 'media_time', 'last_sequence',
+                 'lost_frames', 'out_of_order_frames')
+
+    sample_rate = 8000  # Twilio uses 8kHz
+    bytes_per_second = 16000  # 8kHz * 2 bytes per sample for 16-bit (PCM)
+
     def __init__(self):
-        self.audio_buffer = deque()
+        self.audio_buffer = bytearray()  # Linear PCM of the current utterance
         self.silence_threshold = 40  # Retain this for good speech detection
 
         # Slightly reduced min_speech_duration to be less restrictive, but still aim for coherent speech.
@@ -26,14 +33,74 @@ class AudioProcessor:
         self.utterance_start_time = 0
         self.consecutive_silence_count = 0
         self.speech_detected = False
-        self.sample_rate = 8000  # Twilio uses 8kHz
-        self.bytes_per_second = 16000  # 8kHz * 2 bytes per sample for 16-bit (PCM)
+        self.recorder = None  # Optional audio_archive.CallRecorder
+
+        # VAD runs on media time (seconds of stream audio, from Twilio's timestamps),
+        # not on when frames happen to be processed
+        self.media_time = None  # End of the last accepted frame; anchored on the first one
+        self.last_sequence = None
+        self.lost_frames = 0
+        self.out_of_order_frames = 0
+
+    def advance(self, frame_bytes, timestamp=None, sequence_number=None):
+        """Move the VAD timeline to an inbound mu-law frame.
+
+        ``timestamp`` (ms since stream start) and ``sequence_number`` come from
+        the Twilio media message; without them the frame is assumed to follow
+        the previous one. Returns False for a frame that arrived out of order or
+        twice, which should be dropped. A jump in timestamps counts as lost
+        frames and is filled with silence.
+        """
+        duration = frame_bytes / self.sample_rate  # mu-law: one byte per sample
+        if self.media_time is None:
+            # The stream may not start at 0 (e.g. frames before the session existed)
+            self.media_time = 0.0 if timestamp is None else timestamp / 1000.0
+        start = self.media_time if timestamp is None else timestamp / 1000.0
+
+        if ((sequence_number is not None and self.last_sequence is not None and sequence_number <= self.last_sequence)
+                or start < self.media_time - duration / 2):
+            self.out_of_order_frames += 1
+            return False
+        if sequence_number is not None:
+            self.last_sequence = sequence_number
+
+        gap = start - self.media_time
+        if duration and gap >= duration / 2:
+            self.fill_gap(gap, duration)
+        self.media_time = start + duration
+        return True
+
+    def frame_start_ms(self, frame_bytes):
+        """Media time (ms) at which the frame advance() just accepted starts"""
+        return round(self.media_time * 1000) - frame_bytes // 8
+
+    def fill_gap(self, gap, frame_duration):
+        """Account for lost audio as silence"""
+        missing = round(gap / frame_duration)
+        self.lost_frames += missing
+        self.consecutive_silence_count += missing
+        # Past silence_duration the utterance ends anyway, so don't buffer more than that
+        self.audio_buffer.extend(bytes(int(min(gap, self.silence_duration) * self.sample_rate) * 2))
+        logging.debug(f"Filled {gap * 1000:.0f} ms media gap ({missing} lost frames) with silence")
 
     def add_audio_chunk(self, payload):
-        """Add audio chunk to buffer and process"""
+        """Add base64 audio chunk to buffer and process"""
         try:
             # Decode base64 audio data
             audio_data = base64.b64decode(payload)
+        except Exception as e:
+            logging.error(f"Error decoding audio chunk: {str(e)}")
+            return
+        self.add_audio_frame(audio_data)
+
+    def add_audio_frame(self, audio_data, timestamp=None, sequence_number=None):
+        """Add raw mu-law audio frame to buffer and process"""
+        try:
+            if not self.advance(len(audio_data), timestamp, sequence_number):
+                return
+
+            if self.recorder:
+                self.recorder.write_inbound(audio_data, self.frame_start_ms(len(audio_data)))
 
             # Convert mulaw to linear PCM
             linear_audio = audioop.ulaw2lin(audio_data, 2)
@@ -41,43 +108,51 @@ class AudioProcessor:
             # Calculate RMS for voice activity detection
             rms = audioop.rms(linear_audio, 2)
 
-            current_time = time.time()
+            self.add_analyzed_frame(linear_audio, rms)
 
-            # Voice activity detection
-            is_speech = rms > self.silence_threshold
+        except Exception as e:
+            logging.error(f"Error processing audio chunk: {str(e)}")
 
-            if is_speech:
-                self.last_speech_time = current_time
-                self.consecutive_silence_count = 0
-                self.speech_detected = True
+    def add_analyzed_frame(self, linear_audio, rms):
+        """Run VAD on a frame already decoded to linear PCM and measured.
 
-                # Mark start of utterance
-                if not self.audio_buffer:
-                    self.utterance_start_time = current_time
+        advance() must have accepted the frame first.
+        """
+        current_time = self.media_time
 
-            else:
-                self.consecutive_silence_count += 1
+        # Voice activity detection
+        is_speech = rms > self.silence_threshold
 
-            # Add to buffer
-            self.audio_buffer.append(linear_audio)
+        if is_speech:
+            # Mark start of utterance (the buffer also holds the silence before it)
+            if not self.speech_detected:
+                self.utterance_start_time = current_time - len(linear_audio) / self.bytes_per_second
 
-            logging.debug(f"Audio chunk processed - RMS: {rms}, Speech: {is_speech}")
+            self.last_speech_time = current_time
+            self.consecutive_silence_count = 0
+            self.speech_detected = True
 
-        except Exception as e:
-            logging.error(f"Error processing audio chunk: {str(e)}")
+        else:
+            self.consecutive_silence_count += 1
+
+        # Add to buffer
+        self.audio_buffer += linear_audio
+
+        # Runs for every frame, so skip building the message unless it will be logged
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f"Audio chunk processed - RMS: {rms}, Speech: {is_speech}")
 
     def has_complete_utterance(self):
         """Check if we have a complete utterance ready for processing"""
         if not self.audio_buffer:
             return False
 
-        current_time = time.time()
+        current_time = self.media_time
         utterance_duration = current_time - self.utterance_start_time
         silence_duration = current_time - self.last_speech_time
 
         # Calculate buffer duration in seconds
-        buffer_bytes = sum(len(chunk) for chunk in self.audio_buffer)
-        buffer_duration = buffer_bytes / self.bytes_per_second
+        buffer_duration = len(self.audio_buffer) / self.bytes_per_second
 
         # Key change: rely more on silence_duration after speech,
         # and ensure a minimum meaningful speech duration.
@@ -96,12 +171,14 @@ class AudioProcessor:
             return None
 
         try:
-            # Concatenate all audio chunks
-            combined_audio = b''.join(self.audio_buffer)
+            combined_audio = bytes(self.audio_buffer)
 
             # Clear buffer
             self.audio_buffer.clear()
 
+            if self.recorder:
+                self.recorder.mark_turn_end(round(self.media_time * 1000))
+
             # Reset timing variables
             self.last_speech_time = 0
             self.utterance_start_time = 0
@@ -117,7 +194,8 @@ class AudioProcessor:
             logging.error(f"Error getting audio buffer: {str(e)}")
             return None
 
-    def convert_to_wav_format(self, audio_data):
+    @staticmethod
+    def convert_to_wav_format(audio_data):
         """Convert PCM audio to WAV format for OpenAI"""
         try:
             # Convert to 16kHz sample rate if needed (OpenAI prefers 16kHz)
@@ -130,7 +208,8 @@ class AudioProcessor:
             logging.error(f"Error converting audio format: {str(e)}")
             return audio_data
 
-    def convert_from_openai_format(self, audio_data):
+    @staticmethod
+    def convert_from_openai_format(audio_data):
         """Convert audio from OpenAI format back to Twilio format"""
         try:
             # Convert from 16kHz back to 8kHz
@@ -0,0 +1,108 @@
+"""Per-stage latency and CPU per call: local speech engines vs. the API path.
+
+Usage: python benchmarks/local_speech_bench.py [concurrency ...] [--turns N] [--openai]
+
+Each simulated call runs N turns of speech-to-text on a 3 s utterance
+followed by text-to-speech of a 20-word reply, through the same provider
+stages the media server uses (hedging off). Chat completions are left out
+since they stay in the cloud either way.
+
+The local path uses the engines from LOCAL_STT_ENGINE / LOCAL_TTS_ENGINE
+(default: the model-free ``synthetic`` engine). The API path uses the mock
+backend with API-like latency, or the real OpenAI API with --openai. CPU is
+the server process plus the speech workers, per call turn.
+"""
+import os
+import io
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault('LOCAL_STT_ENGINE', 'synthetic')
+os.environ.setdefault('LOCAL_TTS_ENGINE', 'synthetic')
+
+from providers import MockBackend, ProviderPipeline, _openai_backends  # noqa: E402
+from local_speech import LocalSpeechBackend, get_speech_pool  # noqa: E402
+from conversation_manager import ConversationManager  # noqa: E402
+import metrics  # noqa: E402
+
+REPLY = ' '.join(['word'] * 20)
+
+
+def utterance_wav(seconds=3.0):
+    wav = io.BytesIO()
+    ConversationManager._write_wav_file(wav, b'\x00\x10' * int(16000 * seconds))
+    return wav.getvalue()
+
+
+def cpu_seconds(pids):
+    """CPU time of this process plus the given worker processes (Linux /proc)"""
+    total = time.process_time()
+    ticks = os.sysconf('SC_CLK_TCK')
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks
+        except OSError:
+            pass
+    return total
+
+
+async def drive(pipeline, calls, turns, wav):
+    async def call():
+        for _ in range(turns):
+            await pipeline.stt(wav)
+            await pipeline.tts(REPLY)
+
+    await asyncio.gather(*(call() for _ in range(calls)))
+
+
+def run(backend, calls, turns, pids=()):
+    metrics._recorders.clear()
+    pipeline = ProviderPipeline(backend, deadlines=(60.0, 60.0, 60.0), hedging=False)
+    wav = utterance_wav()
+    start_cpu = cpu_seconds(pids)
+    start = time.perf_counter()
+    asyncio.run(drive(pipeline, calls, turns, wav))
+    wall = time.perf_counter() - start
+    cpu = cpu_seconds(pids) - start_cpu
+    stats = pipeline.stats()
+    return stats['stt']['latency'], stats['tts']['latency'], cpu / (calls * turns), wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('concurrency', type=int, nargs='*', default=[1, 4, 16])
+    parser.add_argument('--turns', type=int, default=5)
+    parser.add_argument('--openai', action='store_true', help='use the real OpenAI API for the API path')
+    args = parser.parse_args()
+
+    if args.openai:
+        api = _openai_backends()[0]
+    else:
+        api = MockBackend(median=0.4, sigma=0.3, seed=7)
+    pool = get_speech_pool().start()
+    local = LocalSpeechBackend(pool, api)
+
+    # Let the workers load their engines before timing
+    asyncio.run(ProviderPipeline(local, hedging=False).stt(utterance_wav(0.5)))
+
+    print(f"local engines: STT {pool.stt_engine}, TTS {pool.tts_engine}, {pool.workers} workers; "
+          f"API path: {'openai' if args.openai else 'mock'}")
+    print(f"{'path':<6} {'calls':>5} {'stt p50':>8} {'stt p95':>8} {'tts p50':>8} {'tts p95':>8} {'cpu ms/turn':>12}")
+    for calls in args.concurrency:
+        for name, backend, pids in (('api', api, ()), ('local', local, pool.worker_pids())):
+            stt, tts, cpu, _ = run(backend, calls, args.turns, pids)
+            print(f"{name:<6} {calls:>5} {stt['p50_ms']:>8.0f} {stt['p95_ms']:>8.0f} "
+                  f"{tts['p50_ms']:>8.0f} {tts['p95_ms']:>8.0f} {cpu * 1000:>12.1f}")
+    pool.close()
+
+
+if __name__ == '__main__':
+    main()
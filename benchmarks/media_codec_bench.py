@@ -0,0 +1,89 @@
+"""Media-frame codec throughput, in messages per second on one core.
+
+Usage: python benchmarks/media_codec_bench.py [messages]
+
+Compares the previous per-message path (json.loads of the full envelope,
+base64 decoded twice, json.dumps of a fresh dict per outbound frame) with
+media_codec's fast-path parser and outbound templates.
+"""
+import os
+import sys
+import json
+import time
+import base64
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from media_codec import parse_message, decode_payload, OutboundEncoder, orjson  # noqa: E402
+
+STREAM_SID = 'MZ18ad3ab5a668481ce02b83e7395059f0'
+
+
+def inbound_messages(count):
+    payload = base64.b64encode(bytes(range(160))).decode('ascii')
+    return [json.dumps({
+        'event': 'media',
+        'sequenceNumber': str(i + 3),
+        'media': {'track': 'inbound', 'chunk': str(i + 2), 'timestamp': str(i * 20), 'payload': payload},
+        'streamSid': STREAM_SID,
+    }, separators=(',', ':')) for i in range(count)]
+
+
+def outbound_payloads(count):
+    payload = base64.b64encode(bytes(300)).decode('ascii')
+    return [payload] * count
+
+
+def baseline_inbound(messages):
+    for message in messages:
+        data = json.loads(message)
+        if data.get('event') == 'media':
+            base64.b64decode(data['media']['payload'])
+            base64.b64decode(data['media']['payload'])
+
+
+def codec_inbound(messages):
+    for message in messages:
+        event_type, data = parse_message(message)
+        if event_type == 'media':
+            decode_payload(data.payload)
+
+
+def baseline_outbound(payloads):
+    for chunk in payloads:
+        json.dumps({'event': 'media', 'streamSid': STREAM_SID, 'media': {'payload': chunk}})
+
+
+def codec_outbound(payloads):
+    encoder = OutboundEncoder(STREAM_SID)
+    for chunk in payloads:
+        encoder.media(chunk)
+
+
+def rate(fn, items, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(items)
+        best = min(best, time.perf_counter() - start)
+    return len(items) / best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    messages = inbound_messages(count)
+    payloads = outbound_payloads(count)
+    print(f"JSON backend: {'orjson' if orjson else 'json'}")
+    print(f"{'path':<10} {'baseline msg/s':>16} {'codec msg/s':>14} {'speedup':>8}")
+    for name, base_fn, codec_fn, items in (
+        ('inbound', baseline_inbound, codec_inbound, messages),
+        ('outbound', baseline_outbound, codec_outbound, payloads),
+    ):
+        base_rate = rate(base_fn, items)
+        codec_rate = rate(codec_fn, items)
+        print(f"{name:<10} {base_rate:>16,.0f} {codec_rate:>14,.0f} {codec_rate / base_rate:>7.1f}x")
+    print(f"\nAt 50 inbound messages/s per call one core parses ~{rate(codec_inbound, messages) / 50:,.0f} calls")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Memory held per live media session, measured with tracemalloc.
+
+Usage: python benchmarks/session_footprint.py [--sessions N] [--budget BYTES]
+
+Creates N call sessions the way the media server does on a stream ``start``
+and reports the bytes each one keeps alive, both idle and while holding a
+buffered utterance. Exits with status 1 if an idle session exceeds the
+budget (default SESSION_BYTES_BUDGET or 1536), so it can run as a check in CI.
+"""
+import os
+import sys
+import asyncio
+import logging
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from websocket_handler import CallSession  # noqa: E402
+
+logging.disable(logging.CRITICAL)
+
+SPEECH_FRAME = b'\x10' * 160  # 20 ms of loud mu-law
+UTTERANCE_FRAMES = 100  # 2 seconds
+BUDGET = int(os.environ.get('SESSION_BYTES_BUDGET', '1536'))  # idle bytes per session
+
+
+def bytes_per_session(count, utterance_frames=0):
+    async def build():
+        sessions = []
+        for index in range(count):
+            session = CallSession(f"MZ{index:032x}")
+            for _ in range(utterance_frames):
+                session.audio_processor.add_audio_frame(SPEECH_FRAME)
+            sessions.append(session)
+        return sessions
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(build())  # warm up imports and caches
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        sessions = loop.run_until_complete(build())
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+    finally:
+        loop.close()
+
+    stats = after.compare_to(before, 'lineno')
+    total = sum(stat.size_diff for stat in stats)
+    top = [stat for stat in stats if stat.size_diff > 0][:5]
+    del sessions
+    return total / count, top
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--budget', type=int, default=BUDGET)
+    parser.add_argument('--top', action='store_true', help='show the biggest allocation sites')
+    args = parser.parse_args()
+
+    idle, idle_top = bytes_per_session(args.sessions)
+    speaking, speaking_top = bytes_per_session(args.sessions, UTTERANCE_FRAMES)
+    utterance_bytes = UTTERANCE_FRAMES * len(SPEECH_FRAME) * 2
+
+    print(f"sessions:                 {args.sessions}")
+    print(f"idle bytes/session:       {idle:,.0f} (budget {args.budget:,})")
+    print(f"with 2 s utterance:       {speaking:,.0f} ({utterance_bytes:,} bytes of PCM)")
+    if args.top:
+        for label, top in (('idle', idle_top), ('with utterance', speaking_top)):
+            print(f"\nlargest allocation sites ({label}):")
+            for stat in top:
+                print(f"  {stat.size_diff / args.sessions:>9,.0f} B  {stat.traceback}")
+
+    if idle > args.budget:
+        print("FAIL: idle session footprint is over budget")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
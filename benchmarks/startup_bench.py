@@ -0,0 +1,59 @@
+"""Import-time and cold-start cost of the server stack.
+
+Usage: python benchmarks/startup_bench.py [repeats]
+
+Each stage runs in a fresh interpreter, the way a new worker would, and
+reports the median wall time and how many threads were running afterwards.
+Plain imports should start no threads; only the full start should.
+
+Runs against a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import os
+import sys
+import json
+import tempfile
+import subprocess
+from statistics import median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGES = [
+    ('import app', 'import app'),
+    ('import websocket_handler', 'import websocket_handler'),
+    ('create_app(start_services=False)', 'import app; app.create_app(start_services=False)'),
+    ('full start (main + init_services)', 'import main; main.init_services()'),
+]
+
+CHILD = """
+import time, json, threading, logging, warnings
+warnings.simplefilter('ignore')
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1000, 'threads': threading.active_count()}}))
+"""
+
+
+def run_stage(statement, env):
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD.format(statement=statement)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    env.setdefault('LOG_LEVEL', 'WARNING')
+
+    print(f"{'stage':<34} {'median ms':>10} {'min ms':>8} {'threads':>8}")
+    for name, statement in STAGES:
+        results = [run_stage(statement, env) for _ in range(repeats)]
+        times = [result['ms'] for result in results]
+        print(f"{name:<34} {median(times):>10.1f} {min(times):>8.1f} {results[-1]['threads']:>8}")
+
+
+if __name__ == '__main__':
+    main()
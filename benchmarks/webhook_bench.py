@@ -0,0 +1,68 @@
+"""Webhook response time vs. size of the call table.
+
+Usage: python benchmarks/webhook_bench.py [rows ...]
+
+Runs against a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import os
+import sys
+import tempfile
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from app import app, db, create_app, init_services  # noqa: E402
+from models import Call  # noqa: E402
+from call_state import call_state  # noqa: E402
+
+create_app(start_services=False)
+init_services(media_server=False)
+
+logging.disable(logging.CRITICAL)
+
+
+def grow_table(target):
+    with app.app_context():
+        existing = Call.query.count()
+        rows = [
+            {'phone_number': '+15550000000', 'call_sid': f"CA{i:032d}", 'status': 'completed'}
+            for i in range(existing, target)
+        ]
+        if rows:
+            db.session.execute(Call.__table__.insert(), rows)
+            db.session.commit()
+
+
+def live_call(n):
+    with app.app_context():
+        state = call_state.create('+15551234567')
+        call_state.attach_sid(state, f"CALIVE{n:028d}", 'calling')
+        return state.call_sid
+
+
+def time_webhooks(client, call_sid, iterations=500):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        client.post('/webhook', data={'CallSid': call_sid, 'CallStatus': 'ringing'})
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    client = app.test_client()
+    print(f"{'rows':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for n, size in enumerate(sizes):
+        grow_table(size)
+        call_sid = live_call(n)
+        p50, p99 = time_webhooks(client, call_sid)
+        call_state.flush()
+        print(f"{size:>10} {p50 * 1000:>10.3f} {p99 * 1000:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
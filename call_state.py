@@ -0,0 +1,292 @@
+import os
+import atexit
+import logging
+import queue
+import threading
+from datetime import datetime
+from sqlalchemy import update
+from app import db
+from models import Call
+from call_stats import call_stats
+
+# Twilio statuses after which no further callbacks arrive for a call
+TERMINAL_STATUSES = frozenset(['completed', 'busy', 'failed', 'no-answer', 'canceled'])
+
+
+class CallState:
+    """Lightweight in-memory view of a Call row; version counts status changes"""
+    __slots__ = ('call_id', 'call_sid', 'stream_sid', 'status', 'phone_number', 'created_at', 'version')
+
+    def __init__(self, call_id, call_sid=None, stream_sid=None, status=None, phone_number=None, created_at=None):
+        self.call_id = call_id
+        self.call_sid = call_sid
+        self.stream_sid = stream_sid
+        self.status = status
+        self.phone_number = phone_number
+        self.created_at = created_at
+        self.version = 0
+
+    @classmethod
+    def from_call(cls, call):
+        return cls(call.id, call.call_sid, call.stream_sid, call.status, call.phone_number, call.created_at)
+
+
+class CallStateService:
+    """In-memory call_sid -> CallState index with write-through to the database.
+
+    Status changes that must be visible immediately (call creation, stream
+    start) are written through synchronously. Twilio status callbacks are
+    queued and applied by a background thread in batches, coalescing several
+    callbacks for the same call into a single row update. A queued callback
+    that has since been overtaken by a synchronous write is dropped.
+    """
+
+    def __init__(self, flush_interval=0.25, max_batch=500):
+        self.app = None
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._by_sid = {}
+        self._lock = threading.Lock()
+        # Held from a status change until its row is committed, so the batch
+        # writer and synchronous writes reach the database in order
+        self._write_lock = threading.Lock()
+        self._events = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self.terminal_listeners = []  # callables taking a call_sid, run when a call ends
+
+    def init_app(self, app):
+        self.app = app
+
+    def start(self):
+        """Start the background batch writer in this process (idempotent).
+
+        Threads don't survive fork, so a forked server worker gets a fresh
+        queue and its own writer; enqueue_status() calls this as well.
+        """
+        if self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            if self._worker_pid not in (None, os.getpid()):
+                # Events queued before the fork belong to the parent
+                self._events = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name='call-state-writer', daemon=True)
+            self._worker.start()
+            self._worker_pid = os.getpid()
+            atexit.register(self.close)
+
+    def close(self, timeout=5.0):
+        """Stop the writer and apply everything still queued (at process exit)"""
+        if self._worker_pid == os.getpid() and self._worker.is_alive():
+            self._events.put(None)
+            self._worker.join(timeout)
+        try:
+            while not self._events.empty():
+                self.flush()
+        except Exception as e:
+            logging.error(f"Error draining call status events: {str(e)}")
+
+    def create(self, phone_number, status='initiating'):
+        """Insert a new Call row and return its state (not yet indexed, no call_sid)"""
+        call = Call(phone_number=phone_number, status=status)
+        db.session.add(call)
+        db.session.commit()
+        state = CallState.from_call(call)
+        call_stats.record_call(state.created_at, status)
+        return state
+
+    def attach_sid(self, state, call_sid, status):
+        """Record the Twilio call SID for a freshly created call and index it"""
+        state.call_sid = call_sid
+        with self._write_lock:
+            self._transition(state, status)
+            db.session.execute(
+                update(Call).where(Call.id == state.call_id).values(call_sid=call_sid, status=status)
+            )
+            db.session.commit()
+        with self._lock:
+            self._by_sid[call_sid] = state
+
+    def get(self, call_sid):
+        """Look up a call by SID, falling back to the database on an index miss"""
+        if not call_sid:
+            return None
+        state = self._by_sid.get(call_sid)
+        if state is not None:
+            return state
+
+        call = Call.query.filter_by(call_sid=call_sid).first()
+        if not call:
+            return None
+        state = CallState.from_call(call)
+        if state.status not in TERMINAL_STATUSES:
+            with self._lock:
+                state = self._by_sid.setdefault(call_sid, state)
+        return state
+
+    def set_status(self, call_sid, status, **fields):
+        """Synchronously update a call's status (and other columns) in index and database"""
+        state = self.get(call_sid)
+        if state is None:
+            return None
+        with self._write_lock:
+            ended_at, version = self._transition(state, status)
+            if version is not None:
+                fields['status'] = status
+            if ended_at:
+                fields['ended_at'] = ended_at
+            if 'stream_sid' in fields:
+                state.stream_sid = fields['stream_sid']
+            if fields:
+                db.session.execute(update(Call).where(Call.id == state.call_id).values(**fields))
+                db.session.commit()
+        if status in TERMINAL_STATUSES:
+            self.forget(call_sid)
+        return state
+
+    def enqueue_status(self, call_sid, status):
+        """Queue a status change to be applied by the batch writer"""
+        if not call_sid or not status:
+            return
+        self.start()
+        state = self._by_sid.get(call_sid)
+        if state is None:
+            self._events.put((call_sid, status, None, None))
+            return
+        ended_at, version = self._transition(state, status)
+        if version is not None:
+            self._events.put((call_sid, status, ended_at, version))
+
+    def _transition(self, state, status):
+        """Move a call to a new status in memory and in the stats rollups.
+
+        Returns (ended_at, version): the end time when this transition finished
+        the call, and the call's version after it. version is None when the
+        change was refused because the call has already ended.
+        """
+        with self._lock:
+            # Webhook threads and the media loop can change the same call at once
+            old_status = state.status
+            if old_status == status:
+                return None, state.version
+            if old_status in TERMINAL_STATUSES:
+                # Late or reordered callbacks never reopen a finished call
+                logging.debug(f"Ignoring status {status} for ended call {state.call_sid} ({old_status})")
+                return None, None
+            state.status = status
+            state.version += 1
+            ended_at = None
+            if status in TERMINAL_STATUSES and old_status not in TERMINAL_STATUSES:
+                ended_at = datetime.utcnow()
+            call_stats.record_status(state.created_at or datetime.utcnow(), old_status, status, ended_at)
+            version = state.version
+        if ended_at:
+            for listener in self.terminal_listeners:
+                try:
+                    listener(state.call_sid)
+                except Exception as e:
+                    logging.error(f"Error in call end listener: {str(e)}")
+        return ended_at, version
+
+    def stats(self):
+        return {
+            'indexed_calls': len(self._by_sid),
+            'pending_status_events': self._events.qsize()
+        }
+
+    def forget(self, call_sid):
+        with self._lock:
+            self._by_sid.pop(call_sid, None)
+
+    def flush(self):
+        """Apply all queued status events now; returns the number of rows updated"""
+        events = []
+        try:
+            while len(events) < self.max_batch:
+                event = self._events.get_nowait()
+                if event is not None:
+                    events.append(event)
+        except queue.Empty:
+            pass
+        if not events:
+            return 0
+        with self.app.app_context():
+            return self._apply(events)
+
+    def _run(self):
+        # A None event (from close()) stops the writer after its current batch
+        stopping = False
+        while not stopping:
+            events = []
+            try:
+                event = self._events.get()
+                while event is not None:
+                    events.append(event)
+                    if len(events) >= self.max_batch:
+                        break
+                    event = self._events.get(timeout=self.flush_interval)
+                stopping = event is None
+            except queue.Empty:
+                pass
+            try:
+                if events:
+                    with self.app.app_context():
+                        self._apply(events)
+            except Exception as e:
+                logging.error(f"Error applying call status batch: {str(e)}")
+
+    def _apply(self, events):
+        # Keep only the latest status per call, and the end time if any event ended it
+        latest = {}
+        ended = {}
+        for call_sid, status, ended_at, version in events:
+            latest[call_sid] = (status, version)
+            if ended_at:
+                ended[call_sid] = ended_at
+
+        with self._write_lock:
+            rows = []
+            written = []
+            for call_sid, (status, version) in latest.items():
+                if version is None:
+                    # Calls that weren't indexed when the callback arrived transition here
+                    state = self.get(call_sid)
+                    if state is None:
+                        logging.warning(f"Status callback for unknown call {call_sid}")
+                        continue
+                    ended_at, version = self._transition(state, status)
+                    if version is None:
+                        continue
+                    ended_at = ended_at or ended.get(call_sid)
+                else:
+                    state = self._by_sid.get(call_sid)
+                    if state is None or state.version != version:
+                        # A later status was written synchronously since this was queued
+                        continue
+                    ended_at = ended.get(call_sid)
+                row = {'id': state.call_id, 'status': status}
+                if ended_at:
+                    row['ended_at'] = ended_at
+                rows.append(row)
+                written.append((call_sid, status))
+
+            try:
+                if rows:
+                    db.session.execute(update(Call), rows)
+                    db.session.commit()
+            except Exception as e:
+                logging.error(f"Database error applying status batch: {str(e)}")
+                db.session.rollback()
+                return 0
+
+        for call_sid, status in written:
+            if status in TERMINAL_STATUSES:
+                self.forget(call_sid)
+
+        logging.info(f"Applied {len(rows)} call status updates from {len(events)} callbacks")
+        return len(rows)
+
+
+call_state = CallStateService()
@@ -0,0 +1,243 @@
+"""Incrementally maintained call statistics for the dashboard.
+
+Counters and time-bucketed rollups are updated as calls change state (via
+``call_state``) and as conversation turns are stored, so ``/stats`` and the
+dashboard never scan the ``Call`` or ``ConversationTurn`` tables. The
+counters are seeded once from aggregate queries the first time they are
+needed after startup; an event that is already committed when seeding runs
+is counted by the seed rather than again by its record_* call.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app import db, socketio
+from models import Call, ConversationTurn
+
+DAILY_BUCKETS = 30
+HOURLY_BUCKETS = 48
+
+
+class _Bucket:
+    __slots__ = ('calls', 'ended', 'duration', 'turns', 'statuses')
+
+    def __init__(self):
+        self.calls = 0
+        self.ended = 0
+        self.duration = 0.0
+        self.turns = 0
+        self.statuses = {}
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'ended': self.ended,
+            'turns': self.turns,
+            'avg_duration_seconds': round(self.duration / self.ended, 1) if self.ended else None,
+            'statuses': dict(self.statuses),
+        }
+
+
+def _day(ts):
+    return ts.strftime('%Y-%m-%d')
+
+
+def _hour(ts):
+    return ts.strftime('%Y-%m-%dT%H:00')
+
+
+def _seconds_between(start, end):
+    """SQL expression for the seconds between two timestamp columns (SQLite or PostgreSQL)"""
+    if db.engine.dialect.name == 'sqlite':
+        return (func.julianday(end) - func.julianday(start)) * 86400.0
+    return func.extract('epoch', end - start)
+
+
+class CallStats:
+    """Lifetime counters plus daily and hourly rollups"""
+
+    def __init__(self, push_interval=1.0):
+        self.app = None
+        self.push_interval = push_interval
+        self._lock = threading.Lock()
+        self._seeded = False
+        self._dirty = threading.Event()
+        self._last_pushed = {}
+        self._worker = None
+        self._reset()
+
+    def init_app(self, app):
+        self.app = app
+
+    def start(self):
+        """Seed the counters and start the thread that pushes changes to dashboards (idempotent)"""
+        if self._worker and self._worker.is_alive():
+            return
+        with self._lock:
+            self._seed()
+        self._worker = threading.Thread(target=self._run, name='call-stats-push', daemon=True)
+        self._worker.start()
+
+    def _buckets(self, ts):
+        """Daily and hourly buckets covering a timestamp, creating and trimming as needed"""
+        now = datetime.utcnow()
+        buckets = []
+        for rollup, key, limit, oldest in (
+            (self.daily, _day(ts), DAILY_BUCKETS, _day(now - timedelta(days=DAILY_BUCKETS - 1))),
+            (self.hourly, _hour(ts), HOURLY_BUCKETS, _hour(now - timedelta(hours=HOURLY_BUCKETS - 1))),
+        ):
+            if key < oldest:
+                continue
+            bucket = rollup.get(key)
+            if bucket is None:
+                bucket = rollup[key] = _Bucket()
+                while len(rollup) > limit:
+                    rollup.popitem(last=False)
+            buckets.append(bucket)
+        return buckets
+
+    def _reset(self):
+        self.total_calls = 0
+        self.ended_calls = 0
+        self.total_duration = 0.0
+        self.total_turns = 0
+        self.statuses = {}
+        self.daily = OrderedDict()
+        self.hourly = OrderedDict()
+
+    def _seed(self):
+        """One-time load of counters from aggregate queries (called with the lock held).
+
+        Returns True if the counters were seeded by this call; a failed seed is
+        retried next time.
+        """
+        if self._seeded:
+            return False
+        self._reset()
+        try:
+            with self.app.app_context():
+                since = datetime.utcnow() - timedelta(days=DAILY_BUCKETS)
+                self.total_calls = db.session.query(func.count(Call.id)).scalar() or 0
+                self.total_turns = db.session.query(func.count(ConversationTurn.id)).scalar() or 0
+                for status, count in db.session.query(Call.status, func.count(Call.id)).group_by(Call.status):
+                    self.statuses[status] = count
+
+                recent = db.session.query(Call.created_at, Call.ended_at, Call.status)\
+                                   .filter(Call.created_at >= since)\
+                                   .order_by(Call.created_at)
+                for created_at, ended_at, status in recent:
+                    for bucket in self._buckets(created_at):
+                        bucket.calls += 1
+                        bucket.statuses[status] = bucket.statuses.get(status, 0) + 1
+                        if ended_at:
+                            bucket.ended += 1
+                            bucket.duration += (ended_at - created_at).total_seconds()
+
+                turns = db.session.query(ConversationTurn.timestamp)\
+                                  .filter(ConversationTurn.timestamp >= since)\
+                                  .order_by(ConversationTurn.timestamp)
+                for (timestamp,) in turns:
+                    for bucket in self._buckets(timestamp):
+                        bucket.turns += 1
+
+                ended_calls, total_duration = db.session.query(
+                    func.count(Call.id), func.sum(_seconds_between(Call.created_at, Call.ended_at))
+                ).filter(Call.ended_at.isnot(None)).one()
+                self.ended_calls = ended_calls or 0
+                self.total_duration = float(total_duration or 0.0)
+        except Exception as e:
+            logging.error(f"Error seeding call statistics: {str(e)}")
+            self._reset()
+            return False
+        self._seeded = True
+        return True
+
+    def record_call(self, created_at, status):
+        """A new call row was created (and committed)"""
+        with self._lock:
+            if self._seed():
+                return
+            self.total_calls += 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            for bucket in self._buckets(created_at):
+                bucket.calls += 1
+                bucket.statuses[status] = bucket.statuses.get(status, 0) + 1
+        self._dirty.set()
+
+    def record_status(self, created_at, old_status, new_status, ended_at=None):
+        """A call moved from old_status to new_status; ended_at is set when it finished.
+
+        Called before the change is written, so a seed here still sees old_status.
+        """
+        with self._lock:
+            self._seed()
+            self._move(self.statuses, old_status, new_status)
+            for bucket in self._buckets(created_at):
+                self._move(bucket.statuses, old_status, new_status)
+                if ended_at:
+                    bucket.ended += 1
+                    bucket.duration += (ended_at - created_at).total_seconds()
+            if ended_at:
+                self.ended_calls += 1
+                self.total_duration += (ended_at - created_at).total_seconds()
+        self._dirty.set()
+
+    def record_turn(self, timestamp):
+        """A conversation turn was stored (and committed)"""
+        with self._lock:
+            if self._seed():
+                return
+            self.total_turns += 1
+            for bucket in self._buckets(timestamp):
+                bucket.turns += 1
+        self._dirty.set()
+
+    @staticmethod
+    def _move(counts, old_status, new_status):
+        if old_status in counts:
+            counts[old_status] -= 1
+            if not counts[old_status]:
+                del counts[old_status]
+        counts[new_status] = counts.get(new_status, 0) + 1
+
+    def summary(self):
+        """Headline numbers; constant size regardless of history"""
+        with self._lock:
+            self._seed()
+            today = self.daily.get(_day(datetime.utcnow())) or _Bucket()
+            return {
+                'total_calls': self.total_calls,
+                'total_turns': self.total_turns,
+                'avg_turns_per_call': round(self.total_turns / self.total_calls, 2) if self.total_calls else None,
+                'avg_duration_seconds': round(self.total_duration / self.ended_calls, 1) if self.ended_calls else None,
+                'statuses': dict(self.statuses),
+                'today': today.to_dict(),
+            }
+
+    def rollups(self):
+        with self._lock:
+            self._seed()
+            return {
+                'daily': {key: bucket.to_dict() for key, bucket in self.daily.items()},
+                'hourly': {key: bucket.to_dict() for key, bucket in self.hourly.items()},
+            }
+
+    def _run(self):
+        while True:
+            self._dirty.wait()
+            self._dirty.clear()
+            try:
+                summary = self.summary()
+                delta = {key: value for key, value in summary.items() if self._last_pushed.get(key) != value}
+                if delta:
+                    self._last_pushed = summary
+                    socketio.emit('stats_update', delta)
+            except Exception as e:
+                logging.error(f"Error pushing call statistics: {str(e)}")
+            # Coalesce bursts of changes into one push per interval
+            time.sleep(self.push_interval)
+
+
+call_stats = CallStats()
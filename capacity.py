@@ -0,0 +1,122 @@
+"""Admission control for the media server.
+
+All Twilio media streams share one event loop, so overload shows up as loop
+lag (late frames, choppy outbound audio, late VAD decisions) on every call
+at once. The capacity model combines three signals - live sessions,
+in-flight provider requests and measured loop lag - to decide whether a new
+stream or a new dial can be taken, and reports the remaining headroom so a
+front proxy can route calls elsewhere.
+"""
+import os
+import asyncio
+import logging
+import functools
+from metrics import get_recorder
+
+
+class LoopLagMonitor:
+    """Samples event-loop lag by measuring how late a periodic sleep wakes up"""
+
+    def __init__(self, interval=0.05, smoothing=0.2):
+        self.interval = interval
+        self.smoothing = smoothing
+        self.lag = 0.0  # exponentially smoothed lag in seconds
+        self.last_lag = 0.0
+        self.recorder = get_recorder('loop_lag')
+        self.task = None
+
+    def start(self):
+        """Start sampling on the running loop"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        return self.task
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - expected)
+            self.lag += self.smoothing * (self.last_lag - self.lag)
+            self.recorder.record(self.last_lag)
+
+
+class CapacityModel:
+    """Session, provider-concurrency and loop-lag limits for one media server"""
+
+    def __init__(self, max_sessions=None, max_provider_requests=None, lag_threshold=None):
+        self.max_sessions = max_sessions or int(os.environ.get('MEDIA_MAX_SESSIONS', '50'))
+        self.max_provider_requests = max_provider_requests or int(os.environ.get('MEDIA_MAX_PROVIDER_REQUESTS', '32'))
+        self.lag_threshold = lag_threshold or float(os.environ.get('MEDIA_LAG_THRESHOLD', '0.1'))
+        self.sessions = 0
+        self.provider_requests = 0
+        self.rejected_streams = 0
+        self.rejected_dials = 0
+        self.lag_monitor = LoopLagMonitor()
+
+    def saturation_reason(self, calls=None):
+        """Why the box cannot take more work right now, or None if it can.
+
+        ``calls`` is the number of calls already in flight (dialing or
+        streaming); it defaults to live media sessions.
+        """
+        if (self.sessions if calls is None else calls) >= self.max_sessions:
+            return 'max_sessions'
+        if self.provider_requests >= self.max_provider_requests:
+            return 'max_provider_requests'
+        if self.lag_monitor.lag >= self.lag_threshold:
+            return 'loop_lag'
+        return None
+
+    def admit_session(self):
+        """Reserve a slot for a new media stream; False if saturated"""
+        reason = self.saturation_reason()
+        if reason:
+            self.rejected_streams += 1
+            logging.warning(f"Rejecting media stream: {reason}")
+            return False
+        self.sessions += 1
+        return True
+
+    def release_session(self):
+        self.sessions = max(0, self.sessions - 1)
+
+    def admit_dial(self, calls_in_flight):
+        """Check whether a new outbound call may be placed; returns the rejection reason or None"""
+        reason = self.saturation_reason(calls_in_flight)
+        if reason:
+            self.rejected_dials += 1
+            logging.warning(f"Rejecting outbound call: {reason}")
+        return reason
+
+    def headroom(self, calls_in_flight=None):
+        """Live capacity snapshot for load balancers and the dashboard"""
+        calls = self.sessions if calls_in_flight is None else calls_in_flight
+        return {
+            'sessions': self.sessions,
+            'calls_in_flight': calls,
+            'max_sessions': self.max_sessions,
+            'session_headroom': max(0, self.max_sessions - calls),
+            'provider_requests': self.provider_requests,
+            'max_provider_requests': self.max_provider_requests,
+            'loop_lag_ms': round(self.lag_monitor.lag * 1000, 3),
+            'lag_threshold_ms': round(self.lag_threshold * 1000, 3),
+            'saturated': self.saturation_reason(calls),
+            'rejected_streams': self.rejected_streams,
+            'rejected_dials': self.rejected_dials,
+        }
+
+
+capacity = CapacityModel()
+
+
+def provider_request(func):
+    """Decorator counting an async provider call as in flight for admission control"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        capacity.provider_requests += 1
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            capacity.provider_requests -= 1
+    return wrapper
@@ -1,23 +1,15 @@
-import os
-import logging
-import asyncio
 import io
-import tempfile
-from openai import OpenAI
+import logging
 from app import db
 from models import ConversationTurn
 from audio_processor import AudioProcessor
+from capacity import provider_request
+from call_stats import call_stats
+from datetime import datetime
+from providers import get_pipeline
 
-class ConversationManager:
-    def __init__(self):
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        self.openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        self.call_id = None
-        self.audio_processor = AudioProcessor()
-        
-        # System prompt for the AI assistant
-        self.system_prompt = """You are a helpful and friendly AI assistant designed to have conversations with senior citizens over the phone. 
+# System prompt for the AI assistant, shared by every call
+SYSTEM_PROMPT = """You are a helpful and friendly AI assistant designed to have conversations with senior citizens over the phone. 
 
 Key guidelines:
 - Speak clearly and at a moderate pace
@@ -31,6 +23,16 @@ Key guidelines:
 
 Remember, this is a voice conversation, so be conversational and natural."""
 
+class ConversationManager:
+    # Provider clients, models, deadlines and hedging live in providers.py; the
+    # prompt is process-wide, so the only per-call state is the call ID
+    __slots__ = ('call_id',)
+
+    system_prompt = SYSTEM_PROMPT
+
+    def __init__(self):
+        self.call_id = None
+
     def set_call_id(self, call_id):
         """Set the call ID for this conversation"""
         self.call_id = call_id
@@ -50,6 +52,7 @@ Remember, this is a voice conversation, so be conversational and natural."""
                 turn.content = content
                 db.session.add(turn)
                 db.session.commit()
+                call_stats.record_turn(datetime.utcnow())
                 
                 logging.info(f"Added {role} message to conversation: {content[:50]}...")
             
@@ -85,30 +88,20 @@ Remember, this is a voice conversation, so be conversational and natural."""
             logging.error(f"Error getting conversation history: {str(e)}")
             return []
 
+    @provider_request
     async def speech_to_text(self, audio_data):
         """Convert speech to text using OpenAI Whisper"""
         try:
             # Convert audio to proper format
-            wav_audio = self.audio_processor.convert_to_wav_format(audio_data)
-            
-            # Create temporary file for Whisper API
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-                # Write WAV header and audio data
-                self._write_wav_file(temp_file, wav_audio)
-                temp_file_path = temp_file.name
-            
-            # Call Whisper API
-            with open(temp_file_path, 'rb') as audio_file:
-                response = self.openai_client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="en"
-                )
-            
-            # Clean up temporary file
-            os.unlink(temp_file_path)
-            
-            transcript = response.text.strip()
+            wav_audio = AudioProcessor.convert_to_wav_format(audio_data)
+            
+            # Build the WAV file in memory for the Whisper API
+            wav_file = io.BytesIO()
+            self._write_wav_file(wav_file, wav_audio)
+            
+            response_text = await get_pipeline().stt(wav_file.getvalue())
+            
+            transcript = response_text.strip()
             logging.info(f"Transcribed: {transcript}")
             
             return transcript
@@ -117,6 +110,7 @@ Remember, this is a voice conversation, so be conversational and natural."""
             logging.error(f"Error in speech to text: {str(e)}")
             return None
 
+    @provider_request
     async def generate_response(self):
         """Generate AI response using OpenAI GPT"""
         try:
@@ -131,39 +125,26 @@ Remember, this is a voice conversation, so be conversational and natural."""
                 messages.append({"role": msg["role"], "content": msg["content"]})
             
             # Generate response
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o-mini",  # Using gpt-4o-mini as specified in PRD
-                messages=messages,
+            response_text = await get_pipeline().llm(
+                messages,
                 max_tokens=150,  # Keep responses concise
                 temperature=0.7
             )
             
-            response_text = response.choices[0].message.content
-            if response_text:
-                response_text = response_text.strip()
-                logging.info(f"Generated response: {response_text}")
-                return response_text
-            else:
-                logging.warning("Empty response from OpenAI")
-                return "I'm sorry, I didn't catch that. Could you please repeat?"
+            response_text = response_text.strip()
+            logging.info(f"Generated response: {response_text}")
+            return response_text
             
         except Exception as e:
             logging.error(f"Error generating response: {str(e)}")
             return "I'm sorry, I didn't catch that. Could you please repeat?"
 
+    @provider_request
     async def text_to_speech(self, text):
         """Convert text to speech using OpenAI TTS"""
         try:
-            # Generate speech using OpenAI TTS
-            response = self.openai_client.audio.speech.create(
-                model="tts-1",
-                voice="alloy",
-                input=text,
-                response_format="pcm"  # Use PCM format for better compatibility
-            )
-            
             # Get raw PCM audio data (OpenAI TTS outputs 24kHz, 16-bit, mono)
-            pcm_audio = response.content
+            pcm_audio = await get_pipeline().tts(text)
             
             import audioop
             import base64
@@ -189,7 +170,8 @@ Remember, this is a voice conversation, so be conversational and natural."""
             logging.error(f"TTS Error traceback: {traceback.format_exc()}")
             return None
 
-    def _write_wav_file(self, file, audio_data):
+    @staticmethod
+    def _write_wav_file(file, audio_data):
         """Write audio data as WAV file"""
         import struct
         
@@ -0,0 +1,119 @@
+"""Greeting audio synthesized while the phone is ringing.
+
+``/initiate_call`` starts text-to-speech for the call's greeting in the
+background as soon as the call is dialed, so by the time the callee
+answers and Twilio opens the media stream the mu-law audio is usually ready
+and playback starts immediately. Synthesis runs on the media server's event
+loop when it is up in this process (sharing its provider pipeline), otherwise
+on one long-lived loop thread of its own, so provider clients and the
+pipeline's latency stats are reused across greetings either way. Entries are
+keyed by call SID and evicted when the call ends without answering or after
+``ttl`` seconds.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+
+DEFAULT_GREETING = "Hello! I'm an AI assistant. How can I help you today?"
+
+
+def greeting_text(name=None, greeting=None):
+    """Greeting for a call, optionally personalized"""
+    if greeting:
+        return greeting
+    if name:
+        return f"Hello {name}! I'm an AI assistant. How can I help you today?"
+    return DEFAULT_GREETING
+
+
+class _Entry:
+    __slots__ = ('text', 'future', 'created')
+
+    def __init__(self, text, future, created):
+        self.text = text
+        self.future = future
+        self.created = created
+
+
+class GreetingCache:
+    def __init__(self, ttl=120.0):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._manager = None
+        # (loop, pid) pairs; a loop copied into a forked child still claims to be
+        # running although its thread stayed behind in the parent
+        self._media_loop = (None, None)
+        self._own_loop = (None, None)
+
+    def use_loop(self, loop):
+        """Synthesize on the media server's loop (called from that loop once it is running)"""
+        self._media_loop = (loop, os.getpid())
+
+    def _loop(self):
+        loop, pid = self._media_loop
+        if pid == os.getpid() and loop.is_running():
+            return loop
+        with self._lock:
+            loop, pid = self._own_loop
+            if pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='greeting-tts', daemon=True).start()
+                self._own_loop = (loop, os.getpid())
+            return loop
+
+    async def _synthesize(self, text):
+        if self._manager is None:
+            from conversation_manager import ConversationManager
+            self._manager = ConversationManager()
+        return await self._manager.text_to_speech(text)
+
+    def prepare(self, call_sid, text):
+        """Start synthesizing the greeting for a call that is being dialed"""
+        self.evict_expired()
+        future = asyncio.run_coroutine_threadsafe(self._synthesize(text), self._loop())
+        with self._lock:
+            self._entries[call_sid] = _Entry(text, future, time.monotonic())
+        logging.info(f"Pre-synthesizing greeting for call {call_sid}")
+
+    async def take(self, call_sid, timeout=5.0):
+        """Claim the greeting for an answered call.
+
+        Returns (text, audio) where audio is base64 mu-law, or None when
+        synthesis failed or didn't finish within ``timeout``. Returns None if
+        no greeting was prepared for this call.
+        """
+        with self._lock:
+            entry = self._entries.pop(call_sid, None)
+        if entry is None:
+            return None
+        try:
+            audio = await asyncio.wait_for(asyncio.wrap_future(entry.future), timeout)
+        except Exception as e:
+            logging.warning(f"Pre-synthesized greeting unavailable for {call_sid}: {str(e) or type(e).__name__}")
+            audio = None
+        return entry.text, audio
+
+    def discard(self, call_sid):
+        """Drop a call's greeting (e.g. the call was never answered)"""
+        with self._lock:
+            entry = self._entries.pop(call_sid, None)
+        if entry is not None:
+            entry.future.cancel()
+
+    def evict_expired(self):
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            expired = [sid for sid, entry in self._entries.items() if entry.created < cutoff]
+            for sid in expired:
+                self._entries.pop(sid).future.cancel()
+        if expired:
+            logging.info(f"Evicted {len(expired)} unclaimed greetings")
+
+    def __len__(self):
+        return len(self._entries)
+
+
+greeting_cache = GreetingCache()
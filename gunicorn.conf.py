@@ -4,16 +4,18 @@ import multiprocessing
 bind = "0.0.0.0:5000"
 backlog = 2048
 
-# Worker processes
+# Worker processes. Keep a single worker: it owns the media server, the
+# call-state writer and the statistics (see post_worker_init)
 workers = 1
 worker_class = "sync"
 threads = 4
 timeout = 120
 keepalive = 30
 
-# Restart workers after this many requests, to help prevent memory leaks
-max_requests = 1000
-max_requests_jitter = 100
+# Never recycle the worker: it holds the live media streams, the call index
+# and the greeting cache (a call makes several HTTP requests, so a request
+# limit would drop calls every few hundred)
+max_requests = 0
 
 # Logging
 loglevel = "info"
@@ -25,4 +27,32 @@ proc_name = "ai_calling_system"
 
 # Server mechanics
 preload_app = True
-reload = True
\ No newline at end of file
+reload = True
+
+
+# Server hooks
+def post_fork(server, worker):
+    """Fork the local speech pool while the new worker has no threads yet.
+
+    Runs before the worker starts its reloader (reload = True) and request
+    threads; post_worker_init is too late for a fork.
+    """
+    from app import start_speech_pool
+    start_speech_pool()
+
+
+def post_worker_init(worker):
+    """Start the background services in the worker that serves requests.
+
+    The app is preloaded in the master and the worker is forked from it, so
+    threads, the media loop and the speech pool must be started here rather
+    than at import time.
+    """
+    from app import init_services
+    init_services()
+
+
+def worker_exit(server, worker):
+    """Write call statuses still queued in the exiting worker"""
+    from call_state import call_state
+    call_state.close()
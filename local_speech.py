@@ -0,0 +1,285 @@
+"""On-box speech engines: STT and TTS in a worker process pool.
+
+Speech-to-text and text-to-speech run on CPU-only models in a pool of worker
+processes, so a turn doesn't cross the network for them (chat completions
+still go to the cloud). Each worker loads its models once when it starts and
+keeps them for its lifetime. Audio travels through shared-memory buffers
+owned by the server process and reused across requests; only file names,
+lengths and text are pickled.
+
+Engines (``LOCAL_STT_ENGINE`` / ``LOCAL_TTS_ENGINE``):
+- ``faster-whisper`` (STT): ``LOCAL_STT_MODEL`` is a model size or path, default ``base.en``
+- ``piper`` (TTS): ``LOCAL_TTS_MODEL`` is the path to a Piper ``.onnx`` voice
+- ``synthetic`` (both): no model, burns ``LOCAL_*_MODEL`` CPU seconds per
+  second of audio (default 0.1); for benchmarking the pool itself
+
+``LOCAL_SPEECH_WORKERS`` sets the pool size (default: CPU count, up to 4) and
+``LOCAL_SPEECH_THREADS`` the threads each engine may use (default 1).
+
+The pool forks its workers, so start it (``app.start_speech_pool``, called by
+the gunicorn ``post_fork`` hook and by ``init_services``) before the server
+starts any threads.
+"""
+import os
+import time
+import queue
+import atexit
+import audioop
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+TTS_SAMPLE_RATE = 24000  # What the providers' synthesize() returns
+BUFFER_BYTES = 4 * 1024 * 1024  # ~87 s of 24 kHz PCM
+
+
+class FasterWhisperEngine:
+    def __init__(self, model, threads):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model or 'base.en', device='cpu', compute_type='int8', cpu_threads=threads)
+
+    def transcribe(self, pcm):
+        """16 kHz 16-bit mono PCM to text"""
+        import numpy as np
+        audio = np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32768.0
+        segments, _ = self.model.transcribe(audio, language='en', beam_size=1)
+        return ' '.join(segment.text.strip() for segment in segments)
+
+
+class PiperEngine:
+    def __init__(self, model, threads):
+        if not model:
+            raise ValueError("LOCAL_TTS_MODEL must point at a Piper voice (.onnx)")
+        from piper import PiperVoice
+        self.voice = PiperVoice.load(model)
+        self.sample_rate = self.voice.config.sample_rate
+
+    def synthesize(self, text):
+        """Returns (16-bit mono PCM, sample rate)"""
+        if hasattr(self.voice, 'synthesize_stream_raw'):
+            pcm = b''.join(self.voice.synthesize_stream_raw(text))
+        else:  # piper-tts >= 1.3
+            pcm = b''.join(chunk.audio_int16_bytes for chunk in self.voice.synthesize(text))
+        return pcm, self.sample_rate
+
+
+class SyntheticEngine:
+    """Model-free engine with a fixed CPU cost per second of audio"""
+
+    def __init__(self, model, threads):
+        self.real_time_factor = float(model or 0.1)
+
+    def _burn(self, seconds):
+        end = time.process_time() + seconds
+        while time.process_time() < end:
+            pass
+
+    def transcribe(self, pcm):
+        self._burn(len(pcm) / 32000 * self.real_time_factor)
+        return "This is a synthetic transcript."
+
+    def synthesize(self, text):
+        seconds = 0.3 * max(1, len(text.split()))
+        self._burn(seconds * self.real_time_factor)
+        return bytes(int(TTS_SAMPLE_RATE * seconds) * 2), TTS_SAMPLE_RATE
+
+
+STT_ENGINES = {'faster-whisper': FasterWhisperEngine, 'synthetic': SyntheticEngine}
+TTS_ENGINES = {'piper': PiperEngine, 'synthetic': SyntheticEngine}
+
+
+# Worker process state: engines loaded by the initializer and attached buffers
+_engines = {}
+_attached = {}
+
+
+def _init_worker(stt_engine, stt_model, tts_engine, tts_model, threads):
+    try:
+        _engines['stt'] = STT_ENGINES[stt_engine](stt_model, threads)
+        _engines['tts'] = TTS_ENGINES[tts_engine](tts_model, threads)
+    except Exception as e:
+        logging.error(f"Local speech worker failed to load engines: {str(e)}")
+        raise
+
+
+def _buffer(name):
+    shm = _attached.get(name)
+    if shm is None:
+        shm = _attached[name] = SharedMemory(name=name)
+    return shm
+
+
+def _wav_pcm(wav):
+    """PCM samples of a WAV file (the data chunk)"""
+    start = bytes(wav[:128]).find(b'data')
+    if start == -1:
+        raise ValueError("no data chunk in WAV audio")
+    return wav[start + 8:]
+
+
+def _warm():
+    return os.getpid()
+
+
+def _transcribe(name, length):
+    view = _buffer(name).buf[:length]
+    try:
+        return _engines['stt'].transcribe(_wav_pcm(view))
+    finally:
+        view.release()
+
+
+def _synthesize(name, text):
+    """Writes 24 kHz PCM into the buffer; returns (length, pcm if it didn't fit else None)"""
+    pcm, sample_rate = _engines['tts'].synthesize(text)
+    if sample_rate != TTS_SAMPLE_RATE:
+        pcm = audioop.ratecv(pcm, 2, 1, sample_rate, TTS_SAMPLE_RATE, None)[0]
+    shm = _buffer(name)
+    if len(pcm) > shm.size:
+        return len(pcm), pcm
+    shm.buf[:len(pcm)] = pcm
+    return len(pcm), None
+
+
+def _read_pcm(buffer, result):
+    length, pcm = result
+    return pcm if pcm is not None else bytes(buffer.buf[:length])
+
+
+class SpeechEnginePool:
+    """Worker processes with warm speech engines, fed through shared-memory buffers"""
+
+    def __init__(self, stt_engine='faster-whisper', stt_model=None, tts_engine='piper', tts_model=None,
+                 workers=None, threads=1, buffer_bytes=BUFFER_BYTES):
+        for engine, engines in ((stt_engine, STT_ENGINES), (tts_engine, TTS_ENGINES)):
+            if engine not in engines:
+                raise ValueError(f"unknown local speech engine {engine!r}")
+        self.stt_engine = stt_engine
+        self.stt_model = stt_model
+        self.tts_engine = tts_engine
+        self.tts_model = tts_model
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.threads = threads
+        self.buffer_bytes = buffer_bytes
+        self.executor = None
+        self._lock = threading.Lock()
+        self._buffers = []
+        self._free = queue.SimpleQueue()
+
+    def start(self):
+        """Fork the workers and have them load their engines (idempotent)"""
+        with self._lock:
+            if self.executor is not None:
+                return self
+            # Workers attach to buffers created here; they must report to this
+            # process's resource tracker, not start their own
+            resource_tracker.ensure_running()
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=_init_worker,
+                initargs=(self.stt_engine, self.stt_model, self.tts_engine, self.tts_model, self.threads),
+            )
+            # With fork the whole pool is created on the first submit
+            for _ in range(self.workers):
+                self.executor.submit(_warm)
+            atexit.register(self.close)
+        logging.info(f"Local speech pool started: {self.workers} workers, "
+                     f"STT {self.stt_engine}, TTS {self.tts_engine}")
+        return self
+
+    def worker_pids(self):
+        return list(self.executor._processes) if self.executor else []
+
+    def _acquire(self, size):
+        try:
+            buffer = self._free.get_nowait()
+        except queue.Empty:
+            buffer = None
+        if buffer is None or buffer.size < size:
+            if buffer is not None:
+                self._free.put(buffer)
+            # Grows to the peak number of concurrent requests, which admission control bounds
+            buffer = SharedMemory(create=True, size=max(size, self.buffer_bytes))
+            self._buffers.append(buffer)
+        return buffer
+
+    async def _call(self, fn, buffer, *args, read=None):
+        self.start()
+        try:
+            future = self.executor.submit(fn, buffer.name, *args)
+        except Exception:
+            self._free.put(buffer)
+            raise
+        try:
+            result = await asyncio.wrap_future(future)
+            return read(buffer, result) if read else result
+        finally:
+            # A cancelled request (e.g. a losing hedge) may still be running in a
+            # worker, so the buffer only comes back once the worker is done with it
+            if future.done():
+                self._free.put(buffer)
+            else:
+                future.add_done_callback(lambda _: self._free.put(buffer))
+
+    async def transcribe(self, wav_audio):
+        buffer = self._acquire(len(wav_audio))
+        buffer.buf[:len(wav_audio)] = wav_audio
+        return await self._call(_transcribe, buffer, len(wav_audio))
+
+    async def synthesize(self, text):
+        """24kHz, 16-bit, mono PCM"""
+        return await self._call(_synthesize, self._acquire(self.buffer_bytes), text, read=_read_pcm)
+
+    def close(self):
+        with self._lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True, cancel_futures=True)
+                self.executor = None
+            for buffer in self._buffers:
+                buffer.close()
+                buffer.unlink()
+            self._buffers = []
+            self._free = queue.SimpleQueue()
+
+
+class LocalSpeechBackend:
+    """Provider backend with STT/TTS on the local pool and chat completions on ``llm_backend``"""
+
+    def __init__(self, pool, llm_backend):
+        self.pool = pool
+        self.llm_backend = llm_backend
+        self.name = f"local:{pool.stt_engine}+{pool.tts_engine}"
+
+    async def transcribe(self, wav_audio):
+        return await self.pool.transcribe(wav_audio)
+
+    async def complete(self, messages, max_tokens=150, temperature=0.7):
+        return await self.llm_backend.complete(messages, max_tokens=max_tokens, temperature=temperature)
+
+    async def synthesize(self, text):
+        return await self.pool.synthesize(text)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_speech_pool():
+    """The process-wide engine pool described by the environment"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SpeechEnginePool(
+                stt_engine=os.environ.get('LOCAL_STT_ENGINE', 'faster-whisper'),
+                stt_model=os.environ.get('LOCAL_STT_MODEL'),
+                tts_engine=os.environ.get('LOCAL_TTS_ENGINE', 'piper'),
+                tts_model=os.environ.get('LOCAL_TTS_MODEL'),
+                workers=int(os.environ.get('LOCAL_SPEECH_WORKERS', '0')) or None,
+                threads=int(os.environ.get('LOCAL_SPEECH_THREADS', '1')),
+            )
+        return _pool
@@ -1,8 +1,14 @@
-from app import app, socketio
+from app import configure_logging, create_app, init_services, socketio
+
+configure_logging()
+# Services start in the serving process: gunicorn's post_worker_init hook
+# (gunicorn.conf.py) or the __main__ block below
+app = create_app(start_services=False)
 
 # For gunicorn deployment
 application = socketio
 
 if __name__ == '__main__':
     # Run the Flask-SocketIO app for development
+    init_services()
     socketio.run(app, host='0.0.0.0', port=5000, debug=True, allow_unsafe_werkzeug=True)
@@ -0,0 +1,100 @@
+"""Twilio Media Stream frame codec.
+
+Inbound ``media`` messages make up nearly all traffic on the media socket, so
+they are parsed with a string-scanning fast path that pulls out the payload,
+timestamp and sequence number without building the full JSON object. Every
+other message (and any media message not in Twilio's compact layout) goes
+through the JSON backend, which is ``orjson`` when it is installed.
+
+Outbound media messages are built from a per-stream template with only the
+base64 payload spliced in.
+"""
+import json
+import binascii
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+    json_loads = json.loads
+
+MEDIA_EVENT = '"event":"media"'
+_PAYLOAD_KEY = '"payload":"'
+_TIMESTAMP_KEY = '"timestamp":"'
+_SEQUENCE_KEY = '"sequenceNumber":"'
+
+
+class MediaFrame:
+    """One inbound audio frame from a media message"""
+    __slots__ = ('payload', 'timestamp', 'sequence_number')
+
+    def __init__(self, payload, timestamp=None, sequence_number=None):
+        self.payload = payload  # base64 mu-law
+        self.timestamp = timestamp  # ms since stream start
+        self.sequence_number = sequence_number
+
+
+def decode_payload(payload):
+    """Decode a base64 payload; a2b_base64 skips the validation overhead of base64.b64decode"""
+    return binascii.a2b_base64(payload)
+
+
+def _int_field(message, key):
+    start = message.find(key)
+    if start == -1:
+        return None
+    start += len(key)
+    end = message.find('"', start)
+    try:
+        return int(message[start:end])
+    except ValueError:
+        return None
+
+
+def parse_message(message):
+    """Parse a message from the media socket into (event_type, data).
+
+    For ``media`` events data is a MediaFrame; for everything else it is the
+    decoded JSON object.
+    """
+    if isinstance(message, str) and MEDIA_EVENT in message[:48]:
+        start = message.find(_PAYLOAD_KEY)
+        if start != -1:
+            start += len(_PAYLOAD_KEY)
+            end = message.find('"', start)
+            if end != -1:
+                return 'media', MediaFrame(
+                    message[start:end],
+                    _int_field(message, _TIMESTAMP_KEY),
+                    _int_field(message, _SEQUENCE_KEY),
+                )
+
+    data = json_loads(message)
+    event_type = data.get('event')
+    if event_type == 'media':
+        media = data.get('media', {})
+        timestamp = media.get('timestamp')
+        sequence_number = data.get('sequenceNumber')
+        return 'media', MediaFrame(
+            media['payload'],
+            int(timestamp) if timestamp is not None else None,
+            int(sequence_number) if sequence_number is not None else None,
+        )
+    return event_type, data
+
+
+class OutboundEncoder:
+    """Pre-built outbound message templates for one stream"""
+    __slots__ = ('media_prefix',)
+
+    _SUFFIX = '"}}'
+
+    def __init__(self, stream_sid):
+        sid = json.dumps(stream_sid)
+        self.media_prefix = '{"event":"media","streamSid":' + sid + ',"media":{"payload":"'
+
+    def media(self, payload):
+        """Media message for a base64 payload (base64 needs no JSON escaping)"""
+        return self.media_prefix + payload + self._SUFFIX
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import deque
+
+
+class LatencyRecorder:
+    """Rolling window of latency samples (in seconds) with percentile summaries"""
+
+    def __init__(self, name, window=2048):
+        self.name = name
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """Record a single latency sample"""
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+
+    def time(self):
+        """Context manager that records the elapsed time of its block"""
+        return _Timer(self)
+
+    def percentile(self, pct):
+        """Return the given percentile (0-100) of the current window, or None"""
+        with self._lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        return _pick(ordered, pct)
+
+    def summary(self):
+        """Summarize the current window in milliseconds"""
+        with self._lock:
+            ordered = sorted(self.samples)
+            count = self.count
+        if not ordered:
+            return {'count': count}
+        return {
+            'count': count,
+            'p50_ms': round(_pick(ordered, 50) * 1000, 3),
+            'p95_ms': round(_pick(ordered, 95) * 1000, 3),
+            'p99_ms': round(_pick(ordered, 99) * 1000, 3),
+            'max_ms': round(ordered[-1] * 1000, 3),
+        }
+
+
+def _pick(ordered, pct):
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class _Timer:
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.recorder.record(time.perf_counter() - self.start)
+        return False
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def get_recorder(name):
+    """Get (or create) the process-wide latency recorder with this name"""
+    recorder = _recorders.get(name)
+    if recorder is None:
+        with _recorders_lock:
+            recorder = _recorders.setdefault(name, LatencyRecorder(name))
+    return recorder
+
+
+def snapshot():
+    """Summaries for every registered recorder, keyed by name"""
+    return {name: recorder.summary() for name, recorder in list(_recorders.items())}
+
+
+_counters = {}
+
+
+def count(name, n=1):
+    """Add to a process-wide event counter"""
+    with _recorders_lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def counters():
+    """Current value of every counter, keyed by name"""
+    with _recorders_lock:
+        return dict(_counters)
@@ -0,0 +1,278 @@
+"""Speech and language provider backends with deadlines, hedging and failover.
+
+Each turn goes through three stages - speech-to-text, chat completion and
+text-to-speech. Every stage runs against a primary backend under a deadline.
+If the primary hasn't answered by the stage's recent latency percentile (or
+fails outright) a hedge request is fired at the fallback backend, or at the
+primary again when no fallback is configured. The first good answer wins and
+the other request is cancelled.
+
+Configuration (environment):
+- ``PROVIDER_BACKEND``: ``openai`` (default), ``local`` (on-box STT/TTS, see
+  ``local_speech.py``, with OpenAI for chat and as the STT/TTS fallback) or ``mock``
+- ``STT_MODEL`` / ``LLM_MODEL`` / ``TTS_MODEL``: primary models
+- ``STT_FALLBACK_MODEL`` / ``LLM_FALLBACK_MODEL`` / ``TTS_FALLBACK_MODEL``: hedge/failover models
+- ``STT_DEADLINE`` / ``LLM_DEADLINE`` / ``TTS_DEADLINE``: per-stage deadlines in seconds
+- ``PROVIDER_HEDGING``: ``0`` disables hedging; ``HEDGE_PERCENTILE`` sets the trigger (default 95)
+"""
+import os
+import io
+import random
+import asyncio
+import logging
+import weakref
+from metrics import get_recorder, LatencyRecorder
+
+
+class StageTimeout(Exception):
+    pass
+
+
+class OpenAIBackend:
+    """OpenAI Whisper / chat / TTS through the async client"""
+
+    def __init__(self, client, stt_model='whisper-1', llm_model='gpt-4o-mini', tts_model='tts-1', voice='alloy'):
+        self.client = client
+        self.stt_model = stt_model
+        self.llm_model = llm_model
+        self.tts_model = tts_model
+        self.voice = voice
+        self.name = f"openai:{llm_model}"
+
+    async def transcribe(self, wav_audio):
+        response = await self.client.audio.transcriptions.create(
+            model=self.stt_model,
+            file=('audio.wav', io.BytesIO(wav_audio), 'audio/wav'),
+            language="en"
+        )
+        return response.text
+
+    async def complete(self, messages, max_tokens=150, temperature=0.7):
+        response = await self.client.chat.completions.create(
+            model=self.llm_model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+        return response.choices[0].message.content
+
+    async def synthesize(self, text):
+        """24kHz, 16-bit, mono PCM"""
+        response = await self.client.audio.speech.create(
+            model=self.tts_model,
+            voice=self.voice,
+            input=text,
+            response_format="pcm"
+        )
+        return response.content
+
+
+class MockBackend:
+    """Local stand-in for testing and benchmarks; latency is lognormal with occasional stalls"""
+
+    def __init__(self, median=0.3, sigma=0.3, stall_rate=0.0, stall_seconds=5.0, failure_rate=0.0, seed=None):
+        self.median = median
+        self.sigma = sigma
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.name = 'mock'
+
+    async def _delay(self):
+        delay = self.median * self.random.lognormvariate(0, self.sigma)
+        if self.random.random() < self.stall_rate:
+            delay += self.stall_seconds
+        await asyncio.sleep(delay)
+        if self.random.random() < self.failure_rate:
+            raise RuntimeError("mock provider failure")
+
+    async def transcribe(self, wav_audio):
+        await self._delay()
+        return "This is a mock transcript."
+
+    async def complete(self, messages, max_tokens=150, temperature=0.7):
+        await self._delay()
+        return "This is a mock reply."
+
+    async def synthesize(self, text):
+        await self._delay()
+        return b'\x00\x00' * int(24000 * 0.05 * max(1, len(text.split())))
+
+
+class Stage:
+    """One pipeline stage: primary backend, optional fallback, deadline and hedging"""
+
+    # Hedge after this long until enough samples exist to estimate the percentile
+    min_samples = 20
+
+    def __init__(self, name, method, primary, fallback=None, deadline=8.0,
+                 hedging=True, hedge_percentile=95, initial_hedge_delay=1.5):
+        self.name = name
+        self.method = method
+        self.primary = primary
+        self.fallback = fallback
+        self.deadline = deadline
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.initial_hedge_delay = initial_hedge_delay
+        self.attempt_latency = LatencyRecorder(f"provider.{name}.attempt")
+        self.latency = get_recorder(f"provider.{name}")
+        self.hedges = 0  # second attempts fired while the primary was still running
+        self.hedge_wins = 0
+        self.failovers = 0  # second attempts fired because the primary failed
+        self.timeouts = 0
+
+    def hedge_delay(self):
+        if len(self.attempt_latency.samples) < self.min_samples:
+            return self.initial_hedge_delay
+        return self.attempt_latency.percentile(self.hedge_percentile)
+
+    async def _attempt(self, backend, args, kwargs):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            result = await getattr(backend, self.method)(*args, **kwargs)
+        except asyncio.CancelledError:
+            # A primary that lost to the hedge took at least this long; leaving
+            # it out would pull the percentile that sets hedge_delay() down
+            if backend is self.primary:
+                self.attempt_latency.record(loop.time() - start)
+            raise
+        if backend is self.primary:
+            self.attempt_latency.record(loop.time() - start)
+        if not result:
+            raise ValueError(f"empty {self.name} response from {backend.name}")
+        return result
+
+    async def __call__(self, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + self.deadline
+        primary = loop.create_task(self._attempt(self.primary, args, kwargs))
+        tasks = {primary}
+        hedge = None
+        hedged = False
+        last_error = None
+        try:
+            while tasks:
+                now = loop.time()
+                if now >= deadline:
+                    break
+                timeout = deadline - now
+                if hedge is None and self.hedging:
+                    timeout = min(timeout, max(0.0, start + self.hedge_delay() - now))
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None:
+                        if task is hedge and hedged:
+                            self.hedge_wins += 1
+                        self.latency.record(loop.time() - start)
+                        return task.result()
+                    last_error = task.exception()
+                    logging.warning(f"{self.name} attempt failed: {str(last_error)}")
+                # Primary is slow (or failed): fire the hedge, or fail over without hedging
+                if hedge is None and (self.hedging or not tasks):
+                    hedged = bool(tasks)
+                    if hedged:
+                        self.hedges += 1
+                    else:
+                        self.failovers += 1
+                    hedge = loop.create_task(self._attempt(self.fallback or self.primary, args, kwargs))
+                    tasks.add(hedge)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        self.latency.record(loop.time() - start)
+        if last_error is not None and loop.time() < deadline:
+            raise last_error
+        self.timeouts += 1
+        raise StageTimeout(f"{self.name} exceeded {self.deadline:.1f}s deadline")
+
+    def stats(self):
+        return {
+            'latency': self.latency.summary(),
+            'hedge_delay_ms': round(self.hedge_delay() * 1000, 1),
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'failovers': self.failovers,
+            'timeouts': self.timeouts,
+        }
+
+
+class ProviderPipeline:
+    """The three per-turn stages"""
+
+    def __init__(self, primary, fallback=None, deadlines=(8.0, 8.0, 8.0), hedging=True, hedge_percentile=95):
+        stt_deadline, llm_deadline, tts_deadline = deadlines
+        common = {'hedging': hedging, 'hedge_percentile': hedge_percentile}
+        self.stt = Stage('stt', 'transcribe', primary, fallback, stt_deadline, **common)
+        self.llm = Stage('llm', 'complete', primary, fallback, llm_deadline, **common)
+        self.tts = Stage('tts', 'synthesize', primary, fallback, tts_deadline, **common)
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in (self.stt, self.llm, self.tts)}
+
+
+def _openai_backends():
+    from openai import AsyncOpenAI
+
+    # Retries are handled by hedging, so the client shouldn't retry on its own
+    client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)
+    primary = OpenAIBackend(
+        client,
+        stt_model=os.environ.get('STT_MODEL', 'whisper-1'),
+        llm_model=os.environ.get('LLM_MODEL', 'gpt-4o-mini'),
+        tts_model=os.environ.get('TTS_MODEL', 'tts-1'),
+    )
+    fallback_models = [os.environ.get(name) for name in ('STT_FALLBACK_MODEL', 'LLM_FALLBACK_MODEL', 'TTS_FALLBACK_MODEL')]
+    fallback = None
+    if any(fallback_models):
+        fallback = OpenAIBackend(
+            client,
+            stt_model=fallback_models[0] or primary.stt_model,
+            llm_model=fallback_models[1] or primary.llm_model,
+            tts_model=fallback_models[2] or primary.tts_model,
+        )
+    return primary, fallback
+
+
+def build_pipeline():
+    """Build the pipeline described by the environment"""
+    backend = os.environ.get('PROVIDER_BACKEND', 'openai')
+    if backend == 'mock':
+        primary, fallback = MockBackend(), None
+    elif backend == 'local':
+        from local_speech import LocalSpeechBackend, get_speech_pool
+        cloud, cloud_fallback = _openai_backends()
+        primary, fallback = LocalSpeechBackend(get_speech_pool(), cloud), cloud_fallback or cloud
+    else:
+        primary, fallback = _openai_backends()
+    return ProviderPipeline(
+        primary,
+        fallback,
+        deadlines=tuple(float(os.environ.get(name, '8')) for name in ('STT_DEADLINE', 'LLM_DEADLINE', 'TTS_DEADLINE')),
+        hedging=os.environ.get('PROVIDER_HEDGING', '1') != '0',
+        hedge_percentile=float(os.environ.get('HEDGE_PERCENTILE', '95')),
+    )
+
+
+# The async HTTP client can't be shared between event loops, so there is one
+# pipeline per loop - in practice just the media server's.
+_pipelines = weakref.WeakKeyDictionary()
+
+
+def get_pipeline():
+    """Provider pipeline for the running event loop, built on first use"""
+    loop = asyncio.get_running_loop()
+    pipeline = _pipelines.get(loop)
+    if pipeline is None:
+        pipeline = _pipelines[loop] = build_pipeline()
+    return pipeline
+
+
+def pipeline_stats():
+    """Hedging and deadline counters for every live pipeline"""
+    return [pipeline.stats() for pipeline in list(_pipelines.values())]
@@ -0,0 +1,230 @@
+"""Replay recorded media streams through the call pipeline on a virtual clock.
+
+Feeds captured caller audio through the same ``AudioProcessor`` and
+``process_audio_chunk`` code the live media server uses, with the speech
+providers stubbed out. VAD runs on the capture's media timestamps and
+provider latency on a virtual clock, so VAD settings can be tuned much
+faster than realtime without placing calls.
+
+Accepted inputs:
+- Twilio media-stream capture: JSON array or JSON lines of stream messages
+- Raw 8 kHz mu-law file (``.ulaw`` / ``.raw``)
+- Audio archive call directory (see ``audio_archive.py``), inbound track
+
+Usage:
+    python replay.py capture.json --silence-duration 1.5 --silence-threshold 60
+"""
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import argparse
+import tempfile
+import logging
+
+FRAME_BYTES = 160  # 20 ms of 8 kHz mu-law
+FRAME_SECONDS = 0.02
+
+
+class VirtualClock:
+    """Manually advanced clock; callable like time.time"""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def advance_to(self, t):
+        if t > self.now:
+            self.now = t
+
+    async def sleep(self, seconds):
+        self.advance(seconds)
+
+
+def load_frames(path):
+    """Return a list of (media_time_seconds, mulaw_bytes) for the caller's audio"""
+    from media_codec import decode_payload
+
+    if os.path.isdir(path):
+        from audio_archive import ArchiveReader, INBOUND
+        frames = []
+        with ArchiveReader(path) as reader:
+            for t_ms, flags, audio in reader.runs(INBOUND):
+                for offset in range(0, len(audio), FRAME_BYTES):
+                    frames.append((t_ms / 1000.0 + offset / 8000.0, bytes(audio[offset:offset + FRAME_BYTES])))
+        return frames
+
+    with open(path, 'rb') as f:
+        raw = f.read()
+
+    if path.endswith(('.json', '.jsonl', '.ndjson')):
+        text = raw.decode('utf-8').strip()
+        if text.startswith('['):
+            messages = json.loads(text)
+        else:
+            messages = [json.loads(line) for line in text.splitlines() if line.strip()]
+        frames = []
+        for message in messages:
+            if message.get('event') != 'media':
+                continue
+            media = message['media']
+            if media.get('track', 'inbound') != 'inbound':
+                continue
+            timestamp = media.get('timestamp')
+            media_time = int(timestamp) / 1000.0 if timestamp is not None else len(frames) * FRAME_SECONDS
+            frames.append((media_time, decode_payload(media['payload'])))
+        return frames
+
+    return [(offset / 8000.0, raw[offset:offset + FRAME_BYTES]) for offset in range(0, len(raw), FRAME_BYTES)]
+
+
+class StubConversationManager:
+    """Stands in for ConversationManager; each provider call costs virtual time"""
+
+    def __init__(self, clock, stt_latency, llm_latency, tts_latency, reply_seconds):
+        self.clock = clock
+        self.stt_latency = stt_latency
+        self.llm_latency = llm_latency
+        self.tts_latency = tts_latency
+        self.reply_audio = base64.b64encode(b'\xff' * int(reply_seconds * 8000)).decode('ascii')
+        self.call_id = None
+        self.turns = 0
+
+    def set_call_id(self, call_id):
+        self.call_id = call_id
+
+    def add_message(self, role, content):
+        pass
+
+    async def speech_to_text(self, audio_data):
+        self.clock.advance(self.stt_latency)
+        self.turns += 1
+        return f"utterance {self.turns}"
+
+    async def generate_response(self):
+        self.clock.advance(self.llm_latency)
+        return "stub reply"
+
+    async def text_to_speech(self, text):
+        self.clock.advance(self.tts_latency)
+        return self.reply_audio
+
+
+class StubWebSocket:
+    def __init__(self):
+        self.frames_sent = 0
+
+    async def send(self, message):
+        self.frames_sent += 1
+
+
+def make_replay_processor(clock, turns):
+    """AudioProcessor that records endpoint timing whenever a turn is taken"""
+    from audio_processor import AudioProcessor
+
+    class ReplayAudioProcessor(AudioProcessor):
+        def get_and_clear_buffer(self):
+            turns.append({
+                'speech_start': self.utterance_start_time,
+                'speech_end': self.last_speech_time,
+                'endpoint': clock(),
+                'buffer_seconds': len(self.audio_buffer) / self.bytes_per_second,
+            })
+            return super().get_and_clear_buffer()
+
+    return ReplayAudioProcessor()
+
+
+async def replay(frames, settings):
+    from websocket_handler import CallSession, process_audio_chunk
+
+    clock = VirtualClock()
+    turns = []
+    processor = make_replay_processor(clock, turns)
+    for name in ('silence_threshold', 'silence_duration', 'min_speech_duration',
+                 'max_speech_duration', 'min_buffer_duration'):
+        if settings.get(name) is not None:
+            setattr(processor, name, settings[name])
+
+    manager = StubConversationManager(clock, settings['stt_latency'], settings['llm_latency'],
+                                      settings['tts_latency'], settings['reply_seconds'])
+    session = CallSession('MZreplay', clock=clock, sleep=clock.sleep,
+                          audio_processor=processor, conversation_manager=manager)
+    session.websocket = StubWebSocket()
+
+    late_frames = 0
+    for media_time, audio in frames:
+        # Frames that arrived while the pipeline was busy are processed late, as on the live server
+        if clock.now > media_time + FRAME_SECONDS:
+            late_frames += 1
+        clock.advance_to(media_time)
+        await process_audio_chunk(session, audio, timestamp=round(media_time * 1000))
+
+    for turn in turns:
+        turn['endpoint_delay'] = turn['endpoint'] - turn['speech_end']
+        turn['utterance_seconds'] = turn['speech_end'] - turn['speech_start']
+
+    return {
+        'audio_seconds': len(frames) * FRAME_SECONDS,
+        'virtual_seconds': clock.now,
+        'late_frames': late_frames,
+        'frames_sent': session.websocket.frames_sent,
+        'turns': turns,
+    }
+
+
+def print_report(report, wall_seconds):
+    print(f"{'turn':>4} {'start':>8} {'speech end':>10} {'endpoint':>9} {'delay':>7} {'speech':>7} {'buffer':>7}")
+    for index, turn in enumerate(report['turns'], 1):
+        print(f"{index:>4} {turn['speech_start']:>8.2f} {turn['speech_end']:>10.2f} {turn['endpoint']:>9.2f} "
+              f"{turn['endpoint_delay']:>7.2f} {turn['utterance_seconds']:>7.2f} {turn['buffer_seconds']:>7.2f}")
+    speedup = report['audio_seconds'] / wall_seconds if wall_seconds else float('inf')
+    print(f"\n{len(report['turns'])} turns, {report['audio_seconds']:.1f}s audio, "
+          f"{report['late_frames']} late frames, replayed in {wall_seconds:.3f}s ({speedup:.0f}x realtime)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('capture', help='media-stream JSON, raw mu-law file or audio archive directory')
+    parser.add_argument('--silence-threshold', type=float)
+    parser.add_argument('--silence-duration', type=float)
+    parser.add_argument('--min-speech-duration', type=float)
+    parser.add_argument('--max-speech-duration', type=float)
+    parser.add_argument('--min-buffer-duration', type=float)
+    parser.add_argument('--stt-latency', type=float, default=0.5, help='stubbed Whisper latency (s)')
+    parser.add_argument('--llm-latency', type=float, default=0.8, help='stubbed chat completion latency (s)')
+    parser.add_argument('--tts-latency', type=float, default=0.6, help='stubbed TTS latency (s)')
+    parser.add_argument('--reply-seconds', type=float, default=2.0, help='duration of stubbed reply audio')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    # The replay never touches a real database or provider
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/replay.db")
+    os.environ.setdefault('OPENAI_API_KEY', 'replay')
+    logging.disable(logging.CRITICAL)
+
+    # Load the app stack before timing starts
+    import websocket_handler  # noqa: F401
+
+    frames = load_frames(args.capture)
+    start = time.perf_counter()
+    report = asyncio.run(replay(frames, vars(args)))
+    wall_seconds = time.perf_counter() - start
+
+    if args.json:
+        report['wall_seconds'] = wall_seconds
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report, wall_seconds)
+
+
+if __name__ == '__main__':
+    main()
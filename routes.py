@@ -1,17 +1,69 @@
 import os
 import logging
 from flask import render_template, request, jsonify
-from twilio.rest import Client
 from twilio.twiml.voice_response import VoiceResponse, Connect, Stream
 from app import app, db
 from models import Call
+from call_state import call_state
+from capacity import capacity
+from call_stats import call_stats
+from greeting_cache import greeting_cache, greeting_text
+from metrics import get_recorder, snapshot, counters
+from providers import pipeline_stats
 
 # Twilio configuration
 TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.environ.get("TWILIO_PHONE_NUMBER")
 
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+_twilio_client = None
+
+def get_twilio_client():
+    """Twilio REST client, created on first use"""
+    global _twilio_client
+    if _twilio_client is None:
+        from twilio.rest import Client
+        _twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    return _twilio_client
+
+def _public_domain():
+    """Resolve the public domain once - use the correct Replit domain"""
+    domain = os.environ.get('REPLIT_DOMAINS', '').split(',')[0] if os.environ.get('REPLIT_DOMAINS') else None
+    if not domain:
+        # Fallback to constructing from REPL_SLUG and REPL_OWNER
+        domain = f"{os.environ.get('REPL_SLUG', 'workspace')}.{os.environ.get('REPL_OWNER', 'user')}.repl.co"
+    return domain
+
+PUBLIC_DOMAIN = _public_domain()
+WEBHOOK_URL = f"https://{PUBLIC_DOMAIN}/webhook"
+STATUS_CALLBACK_URL = f"https://{PUBLIC_DOMAIN}/status_callback"
+# Use the current replit domain but with the WebSocket port
+WEBSOCKET_URL = f"wss://{PUBLIC_DOMAIN}:8000"
+
+def _build_twiml():
+    """Precompute the TwiML documents served by the webhook"""
+    stream_response = VoiceResponse()
+    connect = Connect()
+    connect.append(Stream(url=WEBSOCKET_URL))
+    stream_response.append(connect)
+
+    hold_response = VoiceResponse()
+    hold_response.say("Hello! Please wait while we connect you to our AI assistant.")
+    hold_response.pause(length=1)
+    hold_response.hangup()
+
+    return str(stream_response), str(hold_response), str(VoiceResponse())
+
+STREAM_TWIML, HOLD_TWIML, EMPTY_TWIML = _build_twiml()
+TWIML_HEADERS = {'Content-Type': 'text/xml'}
+
+webhook_latency = get_recorder('webhook')
+
+# Workers are started by app.init_services()
+call_state.init_app(app)
+call_stats.init_app(app)
+# Unanswered calls never claim their pre-synthesized greeting
+call_state.terminal_listeners.append(greeting_cache.discard)
 
 @app.route('/')
 def index():
@@ -27,35 +79,38 @@ def initiate_call():
         if not phone_number:
             return jsonify({'error': 'Phone number is required'}), 400
         
-        # Create call record
-        call = Call(phone_number=phone_number, status='initiating')
-        db.session.add(call)
-        db.session.commit()
+        # Don't dial if the media server couldn't take the call
+        reason = capacity.admit_dial(call_state.stats()['indexed_calls'])
+        if reason:
+            return jsonify({
+                'error': f'System at capacity ({reason}), please try again shortly'
+            }), 503, {'Retry-After': '5'}
         
-        # Get the public URL for webhook - use the correct Replit domain
-        domain = os.environ.get('REPLIT_DOMAINS', '').split(',')[0] if os.environ.get('REPLIT_DOMAINS') else None
-        if not domain:
-            domain = f"{os.environ.get('REPL_SLUG', 'workspace')}.{os.environ.get('REPL_OWNER', 'user')}.repl.co"
-        webhook_url = f"https://{domain}/webhook"
+        # Create call record
+        call = call_state.create(phone_number, status='initiating')
         
         # Initiate Twilio call
-        twilio_call = twilio_client.calls.create(
+        twilio_call = get_twilio_client().calls.create(
             to=phone_number,
             from_=TWILIO_PHONE_NUMBER,
-            url=webhook_url,
-            method='POST'
+            url=WEBHOOK_URL,
+            method='POST',
+            status_callback=STATUS_CALLBACK_URL,
+            status_callback_event=['initiated', 'ringing', 'answered', 'completed'],
+            status_callback_method='POST'
         )
         
+        # Synthesize the greeting while the phone rings
+        greeting_cache.prepare(twilio_call.sid, greeting_text(data.get('name'), data.get('greeting')))
+        
         # Update call record with Twilio call SID
-        call.call_sid = twilio_call.sid
-        call.status = 'calling'
-        db.session.commit()
+        call_state.attach_sid(call, twilio_call.sid, 'calling')
         
         logging.info(f"Call initiated to {phone_number} with SID: {twilio_call.sid}")
         
         return jsonify({
             'success': True,
-            'call_id': call.id,
+            'call_id': call.call_id,
             'call_sid': twilio_call.sid
         })
         
@@ -71,54 +126,60 @@ def initiate_call():
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Twilio webhook endpoint - called when call is answered"""
-    try:
-        call_sid = request.form.get('CallSid')
-        call_status = request.form.get('CallStatus')
-        
-        logging.info(f"Webhook called - CallSid: {call_sid}, Status: {call_status}")
-        
-        # Update call status in database
+    with webhook_latency.time():
         try:
-            call = Call.query.filter_by(call_sid=call_sid).first()
-            if call:
-                call.status = call_status
-                db.session.commit()
-        except Exception as db_error:
-            logging.error(f"Database error in webhook: {str(db_error)}")
-            db.session.rollback()
-        
-        # Create TwiML response to establish Media Stream
-        response = VoiceResponse()
-        
-        # Always establish media stream regardless of status for real-time processing
-        if call_status in ['answered', 'in-progress']:
-            # Get WebSocket URL for media streaming
-            # Use the current replit domain but with the WebSocket port
-            domain = os.environ.get('REPLIT_DOMAINS', '').split(',')[0] if os.environ.get('REPLIT_DOMAINS') else None
-            if not domain:
-                # Fallback to constructing from REPL_SLUG and REPL_OWNER
-                domain = f"{os.environ.get('REPL_SLUG', 'workspace')}.{os.environ.get('REPL_OWNER', 'user')}.repl.co"
+            call_sid = request.form.get('CallSid')
+            call_status = request.form.get('CallStatus')
+            
+            logging.info(f"Webhook called - CallSid: {call_sid}, Status: {call_status}")
             
-            websocket_url = f"wss://{domain}:8000"
-            logging.info(f"Using WebSocket URL: {websocket_url}")
+            # Status is applied to the database by the batch writer
+            call_state.enqueue_status(call_sid, call_status)
+            
+            # Always establish media stream regardless of status for real-time processing
+            if call_status in ['answered', 'in-progress']:
+                logging.info(f"Media stream established for call {call_sid} via {WEBSOCKET_URL}")
+                return STREAM_TWIML, 200, TWIML_HEADERS
             
-            connect = Connect()
-            stream = Stream(url=websocket_url)
-            connect.append(stream)
-            response.append(connect)
-        else:
             # For other statuses, just provide a simple response
-            response.say("Hello! Please wait while we connect you to our AI assistant.")
-            response.pause(length=1)
-            response.hangup()
+            return HOLD_TWIML, 200, TWIML_HEADERS
             
-            logging.info(f"Media stream established for call {call_sid}")
-        
-        return str(response), 200, {'Content-Type': 'text/xml'}
-        
-    except Exception as e:
-        logging.error(f"Webhook error: {str(e)}")
-        return str(VoiceResponse()), 500, {'Content-Type': 'text/xml'}
+        except Exception as e:
+            logging.error(f"Webhook error: {str(e)}")
+            return EMPTY_TWIML, 500, TWIML_HEADERS
+
+@app.route('/status_callback', methods=['POST'])
+def status_callback():
+    """Twilio status callback endpoint - queued and applied in batches"""
+    call_sid = request.form.get('CallSid')
+    call_status = request.form.get('CallStatus')
+    logging.debug(f"Status callback - CallSid: {call_sid}, Status: {call_status}")
+    call_state.enqueue_status(call_sid, call_status)
+    return '', 204
+
+@app.route('/stats')
+def stats():
+    """Precomputed call statistics; add ?rollups=1 for daily and hourly buckets"""
+    data = call_stats.summary()
+    if request.args.get('rollups'):
+        data.update(call_stats.rollups())
+    return jsonify(data)
+
+@app.route('/capacity')
+def capacity_status():
+    """Live headroom; 503 when saturated so a front proxy can route calls elsewhere"""
+    headroom = capacity.headroom(call_state.stats()['indexed_calls'])
+    return jsonify(headroom), 503 if headroom['saturated'] else 200
+
+@app.route('/metrics')
+def metrics():
+    """Latency summaries, event counters and call-state index counters"""
+    return jsonify({
+        'latency': snapshot(),
+        'counters': counters(),
+        'call_state': call_state.stats(),
+        'providers': pipeline_stats()
+    })
 
 @app.route('/call_status/<int:call_id>')
 def call_status(call_id):
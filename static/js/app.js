@@ -5,9 +5,11 @@ class CallManager {
         this.socket = null;
         this.currentCall = null;
         this.isCallActive = false;
+        this.stats = {};
         
         this.initializeSocketIO();
         this.initializeEventListeners();
+        this.loadStats();
         this.logMessage('System initialized', 'info');
     }
     
@@ -35,6 +37,12 @@ class CallManager {
         this.socket.on('status', (data) => {
             this.logMessage(data.message, 'info');
         });
+        
+        this.socket.on('stats_update', (delta) => {
+            // Server pushes only the fields that changed
+            Object.assign(this.stats, delta);
+            this.renderStats();
+        });
     }
     
     initializeEventListeners() {
@@ -112,6 +120,35 @@ class CallManager {
         }
     }
     
+    async loadStats() {
+        try {
+            const response = await fetch('/stats');
+            if (response.ok) {
+                this.stats = await response.json();
+                this.renderStats();
+            }
+        } catch (error) {
+            this.logMessage(`Error loading statistics: ${error.message}`, 'warning');
+        }
+    }
+    
+    renderStats() {
+        const stats = this.stats;
+        const today = stats.today || {};
+        const duration = stats.avg_duration_seconds;
+        
+        document.getElementById('statsCallsToday').textContent = today.calls ?? '-';
+        document.getElementById('statsTotalCalls').textContent = stats.total_calls ?? '-';
+        document.getElementById('statsAvgTurns').textContent = stats.avg_turns_per_call ?? '-';
+        document.getElementById('statsAvgDuration').textContent =
+            duration == null ? '-' : `${Math.floor(duration / 60)}m ${Math.round(duration % 60)}s`;
+        
+        const statuses = Object.entries(today.statuses || {})
+            .map(([status, count]) => `${status}: ${count}`)
+            .join(' • ');
+        document.getElementById('statsStatusToday').textContent = statuses ? `Today by status: ${statuses}` : '';
+    }
+    
     handleCallStatusUpdate(data) {
         const { status, stream_sid } = data;
         
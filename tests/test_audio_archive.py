@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_archive import (  # noqa: E402
+    INBOUND, INDEX_BUFFER_RECORDS, TURN_END, ArchiveReader, CallRecorder,
+)
+
+FRAME = b'\x7f' * 80  # 10 ms of mu-law
+
+
+def test_runs_split_by_gaps_beyond_one_index_buffer(tmp_path):
+    recorder = CallRecorder(str(tmp_path / 'CA1'))
+    frames = INDEX_BUFFER_RECORDS + 144
+    for index in range(frames):
+        recorder.write_inbound(FRAME, index * 40)  # 30 ms gap after every frame
+    recorder.close(wait=True)
+
+    with ArchiveReader(str(tmp_path / 'CA1')) as reader:
+        runs = [(t_ms, len(audio)) for t_ms, flags, audio in reader.runs(INBOUND)]
+        audio = reader.read(INBOUND)
+    assert runs == [(index * 40, len(FRAME)) for index in range(frames)]
+    assert audio == FRAME * frames
+
+
+def test_turn_ends_beyond_one_index_buffer(tmp_path):
+    recorder = CallRecorder(str(tmp_path / 'CA1'))
+    turns = INDEX_BUFFER_RECORDS + 44
+    for index in range(turns):
+        recorder.write_inbound(FRAME, index * 10)
+        recorder.mark_turn_end(index * 10 + 10)
+    recorder.close(wait=True)
+
+    with ArchiveReader(str(tmp_path / 'CA1')) as reader:
+        records = [(t_ms, flags, len(audio)) for t_ms, flags, audio in reader.runs(INBOUND)]
+        turn_ends = reader.turn_ends()
+    assert len(records) == 2 * turns
+    assert records[:2] == [(0, 0, len(FRAME)), (10, TURN_END, 0)]
+    assert turn_ends == [index * 10 + 10 for index in range(turns)]
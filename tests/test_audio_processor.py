@@ -0,0 +1,89 @@
+import os
+import math
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_processor import AudioProcessor  # noqa: E402
+
+SPEECH = b'\x10' * 160  # 20 ms of loud mu-law
+SILENCE = b'\xff' * 160  # 20 ms of mu-law zero
+
+
+def feed(processor, frames):
+    """frames: (audio, timestamp_ms, sequence_number) tuples"""
+    for audio, timestamp, sequence_number in frames:
+        processor.add_audio_frame(audio, timestamp, sequence_number)
+
+
+def test_first_frame_anchors_media_time():
+    processor = AudioProcessor()
+    feed(processor, [(SILENCE, 60, 1), (SILENCE, 80, 2)])
+    assert processor.lost_frames == 0
+    assert math.isclose(processor.media_time, 0.1)
+    assert len(processor.audio_buffer) == 2 * 320
+
+
+def test_timestamp_gap_counts_lost_frames_and_fills_silence():
+    processor = AudioProcessor()
+    feed(processor, [(SPEECH, 0, 1), (SPEECH, 20, 2), (SPEECH, 100, 3)])
+    assert processor.lost_frames == 3
+    assert processor.consecutive_silence_count == 0
+    assert math.isclose(processor.media_time, 0.12)
+    # Two frames, 60 ms of silence for the gap, then the third frame
+    assert len(processor.audio_buffer) == 2 * 320 + 960 + 320
+    assert processor.audio_buffer[640:640 + 960] == bytes(960)
+
+
+def test_gap_fill_is_capped_at_silence_duration():
+    processor = AudioProcessor()
+    feed(processor, [(SPEECH, 0, 1), (SPEECH, 10000, 2)])
+    assert processor.lost_frames == 499
+    assert len(processor.audio_buffer) == 320 + int(processor.silence_duration * 8000) * 2 + 320
+
+
+def test_duplicate_and_reordered_frames_are_dropped():
+    processor = AudioProcessor()
+    feed(processor, [(SPEECH, 0, 1), (SPEECH, 20, 2), (SPEECH, 20, 2), (SPEECH, 0, 1), (SPEECH, 40, 3)])
+    assert processor.out_of_order_frames == 2
+    assert processor.lost_frames == 0
+    assert processor.last_sequence == 3
+    assert len(processor.audio_buffer) == 3 * 320
+
+
+def test_late_timestamp_without_sequence_number_is_dropped():
+    processor = AudioProcessor()
+    feed(processor, [(SPEECH, 0, None), (SPEECH, 20, None), (SPEECH, 0, None)])
+    assert processor.out_of_order_frames == 1
+    assert math.isclose(processor.media_time, 0.04)
+
+
+def test_frames_without_timestamps_follow_each_other():
+    processor = AudioProcessor()
+    feed(processor, [(SPEECH, None, None)] * 3)
+    assert math.isclose(processor.media_time, 0.06)
+    assert processor.lost_frames == 0
+
+
+def test_endpoint_follows_media_time():
+    processor = AudioProcessor()
+    speech_frames = int(processor.min_speech_duration / 0.02)
+    silence_frames = int(processor.silence_duration / 0.02)
+    frames = [(SPEECH, index * 20, index + 1) for index in range(speech_frames)]
+    frames += [(SILENCE, (speech_frames + index) * 20, speech_frames + index + 1)
+               for index in range(silence_frames)]
+    feed(processor, frames[:-1])
+    assert not processor.has_complete_utterance()
+    feed(processor, frames[-1:])
+    assert processor.has_complete_utterance()
+
+
+def test_lost_silence_completes_utterance():
+    processor = AudioProcessor()
+    speech_frames = int(processor.min_speech_duration / 0.02)
+    feed(processor, [(SPEECH, index * 20, index + 1) for index in range(speech_frames)])
+    assert not processor.has_complete_utterance()
+    # The caller's silence never arrived; the next frame is silence_duration later
+    end_ms = speech_frames * 20 + int(processor.silence_duration * 1000)
+    feed(processor, [(SILENCE, end_ms, speech_frames + 1)])
+    assert processor.has_complete_utterance()
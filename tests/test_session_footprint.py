@@ -0,0 +1,11 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from session_footprint import BUDGET, bytes_per_session  # noqa: E402
+
+
+def test_idle_session_within_budget():
+    per_session, top = bytes_per_session(200)
+    assert per_session <= BUDGET, f"{per_session:.0f} bytes/session; largest sites: {top}"
@@ -1,30 +1,57 @@
-import json
+import base64
 import logging
 import asyncio
 import websockets
 import threading
+import time
 from flask_socketio import emit
 from app import app, socketio, db
-from models import Call
+from call_state import call_state
 from audio_processor import AudioProcessor
+from audio_archive import open_recorder
+from capacity import capacity
+from greeting_cache import greeting_cache, DEFAULT_GREETING
+from media_codec import parse_message, decode_payload, OutboundEncoder
+from metrics import count
 from conversation_manager import ConversationManager
 
 # Store active sessions
 active_sessions = {}
 
 class CallSession:
-    def __init__(self, stream_sid):
+    # Per-call state only; prompt, provider clients and config are process-wide
+    __slots__ = ('stream_sid', 'call_sid', 'clock', 'sleep', 'audio_processor', 'conversation_manager',
+                 'websocket', 'encoder', 'recorder', 'ai_speaking')
+
+    def __init__(self, stream_sid, clock=time.time, sleep=asyncio.sleep,
+                 audio_processor=None, conversation_manager=None):
         self.stream_sid = stream_sid
-        self.call = None
-        self.audio_processor = AudioProcessor()
-        self.conversation_manager = ConversationManager()
+        self.call_sid = None  # Set once the call is found; the call itself lives in call_state
+        # clock/sleep are injectable so the replay harness can run sessions on a virtual clock;
+        # VAD itself runs on media timestamps
+        self.clock = clock
+        self.sleep = sleep
+        self.audio_processor = audio_processor or AudioProcessor()
+        self.conversation_manager = conversation_manager or ConversationManager()
         self.websocket = None
-        self.ai_speaking_event = asyncio.Event() # Event to signal AI is speaking
-        self.user_speaking_event = asyncio.Event() # Event to signal user is speaking (for barge-in)
+        self.encoder = OutboundEncoder(stream_sid)
+        self.recorder = None
+        self.ai_speaking = False  # True while AI audio is playing; cleared on barge-in
+
+    def start_recording(self, call_sid):
+        """Attach an audio archive recorder if archiving is enabled"""
+        self.recorder = open_recorder(call_sid, clock=self.clock)
+        self.audio_processor.recorder = self.recorder
+
+    def stop_recording(self):
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+            self.audio_processor.recorder = None
 
     def set_call(self, call):
-        self.call = call
-        self.conversation_manager.set_call_id(call.id)
+        self.call_sid = call.call_sid
+        self.conversation_manager.set_call_id(call.call_id)
 
 @socketio.on('connect')
 def handle_connect():
@@ -46,26 +73,33 @@ async def handle_twilio_websocket(websocket):
 
         async for message in websocket:
             try:
-                data = json.loads(message)
-                event_type = data.get('event')
+                event_type, data = parse_message(message)
 
-                if event_type == 'start':
+                if event_type == 'media':
+                    # Process audio data (decoded once, here) on the stream's own timeline
+                    if session:
+                        await process_audio_chunk(session, decode_payload(data.payload), data.timestamp, data.sequence_number)
+
+                elif event_type == 'start':
                     # Initialize session
                     stream_sid = data['start']['streamSid']
                     call_sid = data['start']['callSid']
 
+                    if not capacity.admit_session():
+                        # 1013: try again later
+                        await websocket.close(code=1013, reason='Media server at capacity')
+                        return
+
                     session = CallSession(stream_sid)
                     session.websocket = websocket
+                    session.start_recording(call_sid)
                     active_sessions[stream_sid] = session
 
                     # Find and update call record
                     with app.app_context():
                         try:
-                            call = Call.query.filter_by(call_sid=call_sid).first()
+                            call = call_state.set_status(call_sid, 'connected', stream_sid=stream_sid)
                             if call:
-                                call.stream_sid = stream_sid
-                                call.status = 'connected'
-                                db.session.commit()
                                 session.set_call(call)
                         except Exception as e:
                             logging.error(f"Database error in stream start: {str(e)}")
@@ -74,7 +108,7 @@ async def handle_twilio_websocket(websocket):
                     logging.info(f"Stream started - StreamSid: {stream_sid}, CallSid: {call_sid}")
 
                     # Send initial greeting
-                    await send_initial_greeting(session)
+                    await send_initial_greeting(session, call_sid)
 
                     # Notify frontend
                     socketio.emit('call_status', {
@@ -82,22 +116,6 @@ async def handle_twilio_websocket(websocket):
                         'stream_sid': stream_sid
                     })
 
-                elif event_type == 'media':
-                    # Process audio data
-                    if session:
-                        # Before processing, check for user speaking to potentially barge-in
-                        payload = data['media']['payload']
-                        audio_data_raw = base64.b64decode(payload)
-                        rms = audioop.rms(audio_data_raw, 2) # Assume 16-bit PCM for RMS calculation on raw data
-                        # If AI is speaking AND user speech is detected (RMS > threshold)
-                        if session.ai_speaking_event.is_set() and rms > session.audio_processor.silence_threshold:
-                            session.ai_speaking_event.clear() # Signal AI to stop speaking
-                            logging.info("Barge-in detected: AI speech interrupted.")
-                            # Optionally send a clear message to Twilio (Twilio can handle it if it gets empty media or disconnect)
-                            # For now, just stopping the server-side sending is sufficient.
-
-                        await process_audio_chunk(session, data['media'])
-
                 elif event_type == 'stop':
                     # Clean up session
                     if session:
@@ -105,9 +123,8 @@ async def handle_twilio_websocket(websocket):
 
                         with app.app_context():
                             try:
-                                if session.call:
-                                    session.call.status = 'completed'
-                                    db.session.commit()
+                                if session.call_sid:
+                                    call_state.set_status(session.call_sid, 'completed')
                             except Exception as e:
                                 logging.error(f"Database error in stream stop: {str(e)}")
                                 db.session.rollback()
@@ -122,8 +139,8 @@ async def handle_twilio_websocket(websocket):
                             'stream_sid': session.stream_sid
                         })
 
-            except json.JSONDecodeError:
-                logging.error("Invalid JSON received from Twilio")
+            except ValueError:
+                logging.error("Invalid message received from Twilio")
             except Exception as e:
                 logging.error(f"Error processing Twilio message: {str(e)}")
 
@@ -133,24 +150,43 @@ async def handle_twilio_websocket(websocket):
         logging.error(f"Twilio WebSocket error: {str(e)}")
     finally:
         # Clean up session
+        if session:
+            session.stop_recording()
+            record_media_gaps(session)
+            capacity.release_session()
         if session and session.stream_sid in active_sessions:
             del active_sessions[session.stream_sid]
 
-async def send_initial_greeting(session):
+def record_media_gaps(session):
+    """Add a finished stream's lost and out-of-order frame counts to the server totals"""
+    processor = session.audio_processor
+    if processor.lost_frames or processor.out_of_order_frames:
+        logging.warning(f"Stream {session.stream_sid}: {processor.lost_frames} lost frames, "
+                        f"{processor.out_of_order_frames} out-of-order frames")
+    count('media.lost_frames', processor.lost_frames)
+    count('media.out_of_order_frames', processor.out_of_order_frames)
+
+async def send_initial_greeting(session, call_sid=None):
     """Send initial AI greeting to the caller"""
     try:
-        greeting_text = "Hello! I'm an AI assistant. How can I help you today?"
-        logging.info(f"Sending initial greeting: {greeting_text}")
+        greeting_text, audio_data = DEFAULT_GREETING, None
+
+        # Use the greeting synthesized during ring time if there is one
+        prepared = await greeting_cache.take(call_sid) if call_sid else None
+        if prepared:
+            greeting_text, audio_data = prepared
+        logging.info(f"Sending initial greeting: {greeting_text} (pre-synthesized: {audio_data is not None})")
 
         # Generate TTS audio
-        audio_data = await session.conversation_manager.text_to_speech(greeting_text)
+        if not audio_data:
+            audio_data = await session.conversation_manager.text_to_speech(greeting_text)
 
         if audio_data:
             logging.info(f"Generated audio data, length: {len(audio_data)}")
 
-            session.ai_speaking_event.set() # Set flag that AI is speaking
+            session.ai_speaking = True # Set flag that AI is speaking
             await send_audio_to_twilio(session, audio_data)
-            session.ai_speaking_event.clear() # Clear flag after speaking
+            session.ai_speaking = False # Clear flag after speaking
 
             # Add to conversation history
             with app.app_context():
@@ -175,106 +211,111 @@ async def send_initial_greeting(session):
         import traceback
         logging.error(f"Greeting error traceback: {traceback.format_exc()}")
     finally:
-        session.ai_speaking_event.clear() # Ensure flag is cleared even on error
+        session.ai_speaking = False # Ensure flag is cleared even on error
 
-async def process_audio_chunk(session, media_data):
-    """Process incoming audio chunk from caller"""
+async def process_audio_chunk(session, audio_data, timestamp=None, sequence_number=None):
+    """Process incoming raw mu-law audio chunk from caller"""
     try:
-        # Check if AI is currently speaking and user is initiating speech (for barge-in)
-        payload = media_data['payload']
-        # add_audio_chunk handles mulaw to linear PCM conversion internally
-        session.audio_processor.add_audio_chunk(payload) 
-
-        # We need a way to detect actual speech here to trigger barge-in reliably.
-        # The add_audio_chunk already calculates RMS and sets self.speech_detected within AudioProcessor.
-        # So we can check session.audio_processor.speech_detected directly after adding the chunk.
-
-        # If AI is speaking and current chunk contains speech, clear AI speaking event (barge-in)
-        if session.ai_speaking_event.is_set() and session.audio_processor.speech_detected:
-            session.ai_speaking_event.clear()
-            logging.info("Barge-in: AI speech interrupted by user.")
-            socketio.emit('call_status', { # Update status on frontend
-                'status': 'User Speaking',
-                'stream_sid': session.stream_sid
-            })
+        # add_audio_frame handles mulaw to linear PCM conversion internally
+        session.audio_processor.add_audio_frame(audio_data, timestamp, sequence_number)
+
+        check_barge_in(session)
 
         # Check if we have a complete utterance
         if session.audio_processor.has_complete_utterance():
-            audio_buffer = session.audio_processor.get_and_clear_buffer()
+            await process_utterance(session)
 
-            if audio_buffer and len(audio_buffer) > 0:
-                buffer_duration = len(audio_buffer) / 16000  # 8kHz * 2 bytes per sample
-                logging.info(f"Processing audio buffer: {len(audio_buffer)} bytes ({buffer_duration:.2f}s)")
+    except Exception as e:
+        logging.error(f"Error processing audio chunk: {str(e)}")
+        import traceback
+        logging.error(f"Audio processing traceback: {traceback.format_exc()}")
+    finally:
+        session.ai_speaking = False # Ensure flag is cleared even on error
 
-                # Convert to text using Whisper
-                transcript = await session.conversation_manager.speech_to_text(audio_buffer)
+def check_barge_in(session):
+    """Stop AI playback if the caller started speaking over it"""
+    # add_audio_frame/add_analyzed_frame already calculate RMS and set speech_detected within AudioProcessor,
+    # so we can check session.audio_processor.speech_detected directly after adding the chunk.
 
-                if transcript and transcript.strip():
-                    logging.info(f"User said: {transcript}")
+    # If AI is speaking and current chunk contains speech, clear AI speaking event (barge-in)
+    if session.ai_speaking and session.audio_processor.speech_detected:
+        session.ai_speaking = False
+        logging.info("Barge-in: AI speech interrupted by user.")
+        socketio.emit('call_status', { # Update status on frontend
+            'status': 'User Speaking',
+            'stream_sid': session.stream_sid
+        })
 
-                    # Add to conversation history
-                    with app.app_context():
-                        try:
-                            session.conversation_manager.add_message("user", transcript)
-                        except Exception as e:
-                            logging.error(f"Database error adding user message: {str(e)}")
+async def process_utterance(session):
+    """Transcribe the buffered utterance, generate a reply and speak it"""
+    audio_buffer = session.audio_processor.get_and_clear_buffer()
 
-                    # Notify frontend
-                    socketio.emit('conversation_update', {
-                        'role': 'user',
-                        'content': transcript,
-                        'stream_sid': session.stream_sid
-                    })
-                    socketio.emit('call_status', { # Update status on frontend
-                        'status': 'AI Thinking', # New status to indicate AI is processing
-                        'stream_sid': session.stream_sid
-                    })
+    if audio_buffer and len(audio_buffer) > 0:
+        buffer_duration = len(audio_buffer) / 16000  # 8kHz * 2 bytes per sample
+        logging.info(f"Processing audio buffer: {len(audio_buffer)} bytes ({buffer_duration:.2f}s)")
 
-                    # Generate AI response
-                    response_text = await session.conversation_manager.generate_response()
+        # Convert to text using Whisper
+        transcript = await session.conversation_manager.speech_to_text(audio_buffer)
 
-                    if response_text:
-                        logging.info(f"AI responded: {response_text}")
+        if transcript and transcript.strip():
+            logging.info(f"User said: {transcript}")
 
-                        # Add to conversation history
-                        with app.app_context():
-                            try:
-                                session.conversation_manager.add_message("assistant", response_text)
-                            except Exception as e:
-                                logging.error(f"Database error adding AI response: {str(e)}")
+            # Add to conversation history
+            with app.app_context():
+                try:
+                    session.conversation_manager.add_message("user", transcript)
+                except Exception as e:
+                    logging.error(f"Database error adding user message: {str(e)}")
 
-                        # Convert to speech
-                        audio_data_tts = await session.conversation_manager.text_to_speech(response_text) # Renamed to avoid conflict
+            # Notify frontend
+            socketio.emit('conversation_update', {
+                'role': 'user',
+                'content': transcript,
+                'stream_sid': session.stream_sid
+            })
+            socketio.emit('call_status', { # Update status on frontend
+                'status': 'AI Thinking', # New status to indicate AI is processing
+                'stream_sid': session.stream_sid
+            })
 
-                        if audio_data_tts:
-                            logging.info(f"Sending TTS audio to Twilio: {len(audio_data_tts)} chars")
-                            session.ai_speaking_event.set() # Set flag that AI is speaking
-                            await send_audio_to_twilio(session, audio_data_tts)
-                            session.ai_speaking_event.clear() # Clear flag after speaking
-                        else:
-                            logging.error("Failed to generate TTS audio")
+            # Generate AI response
+            response_text = await session.conversation_manager.generate_response()
 
-                        # Notify frontend
-                        socketio.emit('conversation_update', {
-                            'role': 'assistant',
-                            'content': response_text,
-                            'stream_sid': session.stream_sid
-                        })
-                        socketio.emit('call_status', { # Update status on frontend
-                            'status': 'Connected', # Or 'AI Idle'
-                            'stream_sid': session.stream_sid
-                        })
-                else:
-                    logging.warning(f"No transcript received for audio buffer of {len(audio_buffer)} bytes")
-            else:
-                logging.warning("Audio buffer is empty after processing")
+            if response_text:
+                logging.info(f"AI responded: {response_text}")
 
-    except Exception as e:
-        logging.error(f"Error processing audio chunk: {str(e)}")
-        import traceback
-        logging.error(f"Audio processing traceback: {traceback.format_exc()}")
-    finally:
-        session.ai_speaking_event.clear() # Ensure flag is cleared even on error
+                # Add to conversation history
+                with app.app_context():
+                    try:
+                        session.conversation_manager.add_message("assistant", response_text)
+                    except Exception as e:
+                        logging.error(f"Database error adding AI response: {str(e)}")
+
+                # Convert to speech
+                audio_data_tts = await session.conversation_manager.text_to_speech(response_text) # Renamed to avoid conflict
+
+                if audio_data_tts:
+                    logging.info(f"Sending TTS audio to Twilio: {len(audio_data_tts)} chars")
+                    session.ai_speaking = True # Set flag that AI is speaking
+                    await send_audio_to_twilio(session, audio_data_tts)
+                    session.ai_speaking = False # Clear flag after speaking
+                else:
+                    logging.error("Failed to generate TTS audio")
+
+                # Notify frontend
+                socketio.emit('conversation_update', {
+                    'role': 'assistant',
+                    'content': response_text,
+                    'stream_sid': session.stream_sid
+                })
+                socketio.emit('call_status', { # Update status on frontend
+                    'status': 'Connected', # Or 'AI Idle'
+                    'stream_sid': session.stream_sid
+                })
+        else:
+            logging.warning(f"No transcript received for audio buffer of {len(audio_buffer)} bytes")
+    else:
+        logging.warning("Audio buffer is empty after processing")
 
 async def send_audio_to_twilio(session, audio_data):
     """Send audio data back to Twilio, with support for interruption"""
@@ -322,23 +363,25 @@ async def send_audio_to_twilio(session, audio_data):
 
         chunk_size_chars = 400 # Adjust this based on Twilio's recommended frame size in base64 characters
 
+        # Decode once up front so archiving doesn't allocate per frame
+        recorder = session.recorder
+        if recorder:
+            raw_audio = memoryview(base64.b64decode(audio_data))
+            raw_chunk_size = chunk_size_chars // 4 * 3
+
         # Split the base64 encoded audio into chunks
         for i in range(0, len(audio_data), chunk_size_chars):
-            if not session.ai_speaking_event.is_set(): # Check if interrupted
+            if not session.ai_speaking: # Check if interrupted
                 logging.info("AI speech interrupted (sending loop broken).")
                 break
 
             chunk = audio_data[i:i + chunk_size_chars]
 
-            message = {
-                "event": "media",
-                "streamSid": session.stream_sid,
-                "media": {
-                    "payload": chunk
-                }
-            }
-            await session.websocket.send(json.dumps(message))
-            await asyncio.sleep(0.02)  # Simulate 20ms audio chunks (adjust as needed)
+            await session.websocket.send(session.encoder.media(chunk))
+            if recorder:
+                raw_offset = i // 4 * 3
+                recorder.write_outbound(raw_audio[raw_offset:raw_offset + raw_chunk_size])
+            await session.sleep(0.02)  # Simulate 20ms audio chunks (adjust as needed)
 
     except Exception as e:
         logging.error(f"Error sending audio to Twilio: {str(e)}")
@@ -349,6 +392,8 @@ def start_websocket_server():
         # Start WebSocket server on port 8000 for Twilio
         server_instance = await websockets.serve(handle_twilio_websocket, "0.0.0.0", 8000)
         logging.info("Twilio WebSocket server started on port 8000")
+        capacity.lag_monitor.start()
+        greeting_cache.use_loop(asyncio.get_running_loop())
         # Keep the server running
         await server_instance.wait_closed()
 
@@ -361,6 +406,12 @@ def start_websocket_server():
     finally:
         loop.close()
 
-# Start WebSocket server in a separate thread
-websocket_thread = threading.Thread(target=start_websocket_server, daemon=True)
-websocket_thread.start()
\ No newline at end of file
+websocket_thread = None
+
+def start_media_server():
+    """Start the WebSocket server in a separate thread (idempotent)"""
+    global websocket_thread
+    if websocket_thread is None or not websocket_thread.is_alive():
+        websocket_thread = threading.Thread(target=start_websocket_server, name='media-server', daemon=True)
+        websocket_thread.start()
+    return websocket_thread